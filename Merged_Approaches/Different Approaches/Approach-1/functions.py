@@ -1,7 +1,6 @@
 # run_layoutgpt_2d.py
-import json
-import torch
-from transformers import GPT2TokenizerFast
+# torch / transformers imports removed: nothing in this module used them,
+# and importing torch alone added seconds of startup to every CLI run.
 
 # Mapping LLM name to model id
 llm_name2id = {
@@ -34,3 +33,24 @@ def gpt_generation(messages, f_gpt_create, llm_id="gpt-4", n_iter=1):
     )
     response_text = [choice.message.content for choice in response.choices]
     return response_text, response
+
+def gpt_generation_stream(messages, f_gpt_create, llm_id="gpt-4", on_chunk=None):
+    """Streams a single chat completion instead of blocking for the full
+    response. on_chunk (if given) is called with each text delta as it
+    arrives; the concatenated response is returned at the end."""
+    response = f_gpt_create(
+        model=llm_id,
+        messages=messages,
+        temperature=0.7,
+        stream=True
+    )
+    parts = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content or ""
+        if piece:
+            parts.append(piece)
+            if on_chunk is not None:
+                on_chunk(piece)
+    return "".join(parts)
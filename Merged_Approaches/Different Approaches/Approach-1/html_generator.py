@@ -1,36 +1,188 @@
+import concurrent.futures
+import functools
 import json
+import logging
 import os
+import pathlib
+import shutil
+import string
 import sys
+import time
+from dataclasses import dataclass
+import orjson
 import requests
 import re # Import the re module for regular expressions
 from dotenv import load_dotenv
-from openai import OpenAI
-from supabase import create_client, Client
 import argparse
 
+# NOTE: the OpenAI client class is imported lazily on an actual cache miss;
+# cache hits and --help never pay the openai package import.
+
 # Assuming run_layoutgpt_2d is a local module you have
-from functions import gpt_generation, llm_name2id
+from functions import gpt_generation, gpt_generation_stream, llm_name2id
+import llm_cache
+
+# The shared Supabase access layer lives one directory up so Approach-1 and
+# Approach-2 reuse the same client singleton and fetch helpers.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from supabase_helpers import (
+    get_supabase,
+    fetch_creative_data_from_supabase,
+    fetch_campaign_prompt_from_supabase,
+    fetch_creative_bundle,
+    fetch_creatives_batch,
+    get_font_size_px,
+    safe_get_field,
+    _dig,
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# --- Supabase Configuration ---
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Ensure this is your service_role key
+# Verbose payload dumps are gated behind LOG_LEVEL=DEBUG so the hot path
+# never serializes structures that nobody is reading.
+logging.basicConfig(stream=sys.stderr, format="%(message)s",
+                    level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# -------- Prompt Constants --------
+# Hoisted to module scope so every run sends a byte-identical static
+# prefix (required for OpenAI prompt caching) and nothing is rebuilt
+# per invocation. Only the creative JSON and dimensions vary.
+SYSTEM_PROMPT = (
+    "You are an expert HTML & CSS ad designer. "
+    "Given a JSON object that describes a marketing creative — like background, imagery, text blocks, and CTA buttons — "
+    "generate ONLY the inner markup that belongs inside the creative container div. "
+    "Do NOT emit <html>, <head>, <style> or <body> tags — the caller wraps your markup in a fixed responsive skeleton "
+    "that already handles the container sizing, centering and aspect ratio. "
+    "Prefer relative sizing (percentages, vw/vh) for elements within the main container where possible to ensure responsiveness. "
+    "Use absolute positioning based on the estimated-coords provided, but express ALL positions and sizes "
+    "responsively: left/top/width/height as percentages of the creative container, font sizes in vw units "
+    "(percent of container width) — never in px. "
+    "Ensure fonts, colors, and styles match the JSON data. "
+    "Use background images where applicable. "
+    "Make sure the HTML is visually balanced, looks professional, and resembles a typical marketing creative. "
+    "Use reasonable default styling for any unspecified properties, via inline style attributes. "
+    "Output ONLY valid HTML code — no explanations.\n\n"
+    "**IMPORTANT: The final creative must be responsive within its container, maintaining the original aspect ratio given in the JSON 'dimensions' and scaling its internal elements proportionally.**\n"
+    "**Also, ensure the background image is entirely visible without any cropping, even if that means letterboxing/pillarboxing (empty space) is introduced.**\n\n"
+    "**CRITICAL LAYOUT INSTRUCTIONS FOR OPTIMAL VISUAL BALANCE AND READABILITY:**\n\n"
+    "1.  **Strict No-Overlap Rule:** ABSOLUTELY ENSURE that no text block, CTA button, or the brand logo overlaps with any primary subjects in the background image (e.g., people, faces, products, animals, or other prominent visual elements). Identify and utilize clear, empty background space.\n\n"
+    "2. Follow placement of text using the 'relative_position' of the text with one another.'top' for text does not necessarily mean top of the marketing creative, it means top modt text box.\n\n"
+    "3.  **Guaranteed Readability:**\n"
+    "    * For ALL text, ensure maximum contrast against the background. If the background image is busy or has varying colors, *add a subtle, semi-transparent background color (e.g., a slightly opaque black or white box) or a strong text-shadow behind the text* to ensure it pops and is easily readable.\n"
+    "    * The text must be legible at a glance.\n\n"
+    "4. **Maintain a visual heirarcy where the background image especially the part of the image which contains people/products/animals/anything with a lot of visual features is the most important should not be masked by any other element.**\"\n\n"
+    "5.  **Professional Aesthetic:** The final HTML must render as a professional, clean, and visually appealing marketing advertisement. Elements should be neatly aligned and spaced, avoiding any cluttered or amateurish appearance.\n\n"
+    "6.  **Absolute Positioning Refinement:** Use the provided dimensions and positions as a guide, but adjust absolute `top`, `left`, `right`, `bottom` values as necessary to strictly adhere to the no-overlap and readability rules."
+)
+
+USER_PROMPT_TEMPLATE = """
+Please produce a complete HTML document implementing the creative described below exactly,
+using absolute positioning and applying the specified fonts, colors, background textures,
+and texts. Ensure it looks like a polished marketing ad.
+
+The creative's original dimensions are {width}x{height}.
+
+Here is the JSON describing the marketing creative layout:
+{creative_json}
+"""
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("Error: SUPABASE_URL or SUPABASE_KEY environment variables are not set for Supabase client.", file=sys.stderr)
-    sys.exit(1)
+# Fixed document skeleton the LLM's inner markup is substituted into.
+# string.Template ($-substitution) rather than str.format so the CSS braces
+# need no escaping; built once at import. This replaces the old flow of
+# asking the model for a full document and then regex-rewriting its <style>
+# block — the responsive CSS is simply correct from the start.
+_SKELETON_TPL = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Marketing Creative</title>
+<style>
+/* RESP_v1 */
+body {
+    margin: 0;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    min-height: 100vh;
+    background-color: #f0f0f0;
+    font-family: Arial, sans-serif;
+}
+.creative-container {
+    position: relative;
+    width: 100%;
+    padding-bottom: calc(100% * ($height / $width));
+    overflow: hidden;
+    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+    border-radius: 8px;
+    background-color: #ffffff;
+    transform-origin: top left;
+}
+.creative-image {
+    position: absolute;
+    width: 100%;
+    height: 100%;
+    object-fit: contain;
+    top: 0;
+    left: 0;
+}
+</style>
+</head>
+<body>
+    <div class="creative-container">
+$body
+    </div>
+</body>
+</html>""")
+
+# -------- Fetch snapshot cache --------
+# Agentic pipelines rerun this CLI when the LLM call fails; a short-lived
+# on-disk snapshot of the fetched row + campaign prompt lets the retry skip
+# both Supabase round trips (mapping itself is microseconds and reruns).
+# Same layout as llm_cache: a dot-directory next to the script with an env
+# kill switch. orjson is the serializer — msgpack isn't a dependency here
+# and the rows are plain JSON anyway.
+CREATIVE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".creative_cache")
+CREATIVE_CACHE_TTL = 60  # seconds; retries are near-immediate
+CREATIVE_CACHE_ENABLED = os.getenv("CREATIVE_CACHE", "1") != "0"
+
+
+def _load_creative_snapshot(creative_id):
+    """Returns (creative_row, campaign_prompt) if a fresh snapshot exists."""
+    if not CREATIVE_CACHE_ENABLED:
+        return None
+    path = os.path.join(CREATIVE_CACHE_DIR, f"{creative_id}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > CREATIVE_CACHE_TTL:
+            return None
+        with open(path, 'rb') as f:
+            snap = orjson.loads(f.read())
+        return snap["creative"], snap.get("campaign_prompt")
+    except (OSError, KeyError, orjson.JSONDecodeError):
+        return None
+
+
+def _save_creative_snapshot(creative_id, creative_row, campaign_prompt):
+    """Best-effort write; a failed snapshot never fails the run."""
+    if not CREATIVE_CACHE_ENABLED:
+        return
+    try:
+        os.makedirs(CREATIVE_CACHE_DIR, exist_ok=True)
+        path = os.path.join(CREATIVE_CACHE_DIR, f"{creative_id}.json")
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps({"creative": creative_row, "campaign_prompt": campaign_prompt}))
+    except (OSError, orjson.JSONEncodeError) as e:
+        print(f"Warning: Could not write creative snapshot: {e}", file=sys.stderr)
 
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("Supabase client initialized.", file=sys.stderr)
-except Exception as e:
-    print(f"Error initializing Supabase client: {e}", file=sys.stderr)
-    sys.exit(1)
 
 # -------- Helper Functions --------
 
+def _emit_stdout_chunk(piece):
+    """Forwards a streamed LLM text delta to stdout immediately."""
+    sys.stdout.write(piece)
+    sys.stdout.flush()
+
 def download_image(image_url, save_path):
     """Downloads an image from a URL and saves it locally.
     Note: This specific function is not directly called in this HTML generation
@@ -39,67 +191,159 @@ def download_image(image_url, save_path):
     """
     print(f"Downloading image from {image_url} to {save_path}...", file=sys.stderr)
     try:
-        response = requests.get(image_url)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
+        # Stream the body straight to disk in 64 KB chunks instead of
+        # buffering the whole image in memory; the timeout keeps a hung
+        # server from stalling generation indefinitely.
+        with requests.get(image_url, stream=True, timeout=(3, 30)) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(save_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=64 * 1024)
         print(f"Image saved to {save_path}", file=sys.stderr)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Failed to download image from {image_url}: {e}", file=sys.stderr)
         return False
 
-def get_font_size_px(size_str):
-    """Converts a descriptive font size string to an approximate pixel value.
-    Note: This specific function is not directly called in this HTML generation
-    logic but is included as it was part of your provided helpers.
-    """
-    size_map = {
-        "small": 20, "medium": 30, "large": 45,
-        "x-large": 60, "xx-large": 80, "xxx-large": 100
-    }
-    return size_map.get(size_str.lower(), 30)
-
-def fetch_creative_data_from_supabase(creative_id: str):
-    print(f"\n--- Fetching creative data for ID: {creative_id} from Supabase ---", file=sys.stderr)
-    try:
-        response = supabase.table('creatives_duplicate').select('*').eq('creative_id', creative_id).single().execute()
-        data = response.data
 
-        if not data:
-            print(f"No creative found with ID: {creative_id}", file=sys.stderr)
-            raise ValueError(f"Creative ID {creative_id} not found.")
-
-        print(f"Creative data fetched successfully for ID: {creative_id}", file=sys.stderr)
-        # print(f"Raw Supabase creative data: {json.dumps(data, indent=2)}", file=sys.stderr) # Keep commented for production verbosity
-        return data
-    except Exception as e:
-        print(f"Error in fetching creative data: {e}", file=sys.stderr)
-        raise
-
-def fetch_campaign_prompt_from_supabase(campaign_id: str):
+# -------- Mapped-schema data layout --------
+# The mapped creative used to be a five-level nested dict; these slotted
+# dataclasses cut the per-field hash lookups and memory while serializing
+# natively (and in stable field order) through orjson for the LLM prompt.
+# Fields carry no defaults so __slots__ stays valid on older interpreters.
+
+@dataclass
+class Background:
+    __slots__ = ("type", "color", "description", "image")
+    type: str
+    color: str
+    description: str
+    image: object
+
+@dataclass
+class Imagery:
+    __slots__ = ("background_image_url",)
+    background_image_url: object
+
+@dataclass
+class Canvas:
+    __slots__ = ("background", "layout_grid", "bleed_safe_margins", "Imagery",
+                 "Text_Blocks", "cta_buttons", "brand_logo", "brand_colors",
+                 "slogans", "legal_disclaimer", "decorative_elements")
+    background: Background
+    layout_grid: object
+    bleed_safe_margins: object
+    Imagery: Imagery
+    Text_Blocks: list
+    cta_buttons: list
+    brand_logo: dict
+    brand_colors: list
+    slogans: object
+    legal_disclaimer: object
+    decorative_elements: list
+
+@dataclass
+class RequiredElements:
+    __slots__ = ("campaign_id", "campaign_prompt", "placement", "dimensions",
+                 "format", "Canvas")
+    campaign_id: object
+    campaign_prompt: str
+    placement: object
+    dimensions: dict
+    format: object
+    Canvas: Canvas
+
+# Container columns the fast-path mapper trusts to be pre-decoded JSONB.
+# If any of these arrive as a raw string the interpretive mapper runs instead.
+_JSONB_CONTAINER_FIELDS = (
+    "dimensions", "background", "imagery", "text_blocks", "cta_buttons",
+    "brand_logo", "brand_colors", "decorative_elements"
+)
+
+def _map_required_elements_fast(d: dict, campaign_prompt: str) -> dict:
     """
-    Fetches the campaign_prompt from the 'campaigns_duplicate' table in Supabase.
+    Straight-line specialization of map_supabase_to_required_elements_schema
+    for the common case where the Supabase client already decoded every JSONB
+    column. No per-field JSON parsing and no defensive isinstance chains on
+    the container fields — the caller has verified none of them is a string.
     """
-    print(f"\n--- Fetching campaign prompt for ID: {campaign_id} from Supabase ---", file=sys.stderr)
-    try:
-        response = supabase.table('campaigns_duplicate') \
-                            .select('campaign_prompt') \
-                            .eq('campaign_id', campaign_id) \
-                            .single() \
-                            .execute()
+    background = d.get("background") or {}
+    imagery = d.get("imagery") or []
 
-        data = response.data
-
-        if not data:
-            print(f"No campaign found with ID: {campaign_id}", file=sys.stderr)
-            raise ValueError(f"Campaign ID {campaign_id} not found.")
+    background_image_url = None
+    for img_data in imagery:
+        if isinstance(img_data, dict) and img_data.get("type") == "background" and img_data.get("url"):
+            background_image_url = img_data["url"]
+            break
+
+    text_blocks = [
+        {
+            "font": block.get("font_family", "Inter"),
+            "size": block.get("font_size", "medium"),
+            "text": block.get("text", ""),
+            "color": block.get("color", "#000000"),
+            "position": block.get("alignment", "center")
+        }
+        for block in (d.get("text_blocks") or []) if isinstance(block, dict)
+    ]
+
+    cta_raw = d.get("cta_buttons") or []
+    if isinstance(cta_raw, dict):
+        cta_raw = list(cta_raw.values())
+    cta_buttons = [
+        {
+            "text": cta.get("text", "Shop Now"),
+            "color": cta.get("text_color", "#ffffff"),
+            "position": "bottom-center",
+            "background": cta.get("bg_color", "#007bff"),
+            "style": cta.get("style", "primary"),
+            "url": cta.get("url", "https://example.com")
+        }
+        for cta in cta_raw if isinstance(cta, dict)
+    ]
+
+    brand_logo_raw = d.get("brand_logo") or {}
+    brand_logo = {
+        "url": brand_logo_raw.get("url"),
+        "text_alt": brand_logo_raw.get("text_alt", "Brand Logo"),
+        "size": "medium",
+        "position": "top-left"
+    }
 
-        print(f"Campaign prompt fetched successfully for ID: {campaign_id}", file=sys.stderr)
-        return data.get('campaign_prompt', "")
-    except Exception as e:
-        print(f"Error fetching campaign prompt: {e}", file=sys.stderr)
-        raise
+    decorative_elements = [
+        {
+            "shape_type": element.get("shape_type", "none"),
+            "color": element.get("color", "#cccccc"),
+            "animation": element.get("animation", "subtle")
+        }
+        for element in (d.get("decorative_elements") or []) if isinstance(element, dict)
+    ]
+
+    return {"required_elements": RequiredElements(
+        campaign_id=d.get("campaign_id"),
+        campaign_prompt=campaign_prompt,
+        placement=safe_get_field(d, "placement", "social"),
+        dimensions=d.get("dimensions") or {"width": 1080, "height": 1920},
+        format=safe_get_field(d, "format", "static"),
+        Canvas=Canvas(
+            background=Background(
+                type=background.get("type", "solid"),
+                color=background.get("color", "#ffffff"),
+                description=background.get("description", ""),
+                image=background_image_url
+            ),
+            layout_grid=safe_get_field(d, "layout_grid", "free"),
+            bleed_safe_margins=safe_get_field(d, "bleed_safe_margins", None),
+            Imagery=Imagery(background_image_url=background_image_url),
+            Text_Blocks=text_blocks,
+            cta_buttons=cta_buttons,
+            brand_logo=brand_logo,
+            brand_colors=d.get("brand_colors") if isinstance(d.get("brand_colors"), list) else [],
+            slogans=safe_get_field(d, "slogan", None),
+            legal_disclaimer=safe_get_field(d, "legal_disclaimer", None),
+            decorative_elements=decorative_elements
+        )
+    )}
 
 def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campaign_prompt: str) -> dict:
     """
@@ -108,21 +352,19 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     This version aligns with Approach-2's mapping logic.
     """
     print("\n--- Mapping Supabase data to required_elements schema (Approach-1) ---", file=sys.stderr)
-    # print(f"Mapping input - supabase_creative_data type: {type(supabase_creative_data)}, value: {json.dumps(supabase_creative_data, indent=2)}", file=sys.stderr)
-    print(f"Mapping input - campaign_prompt: {campaign_prompt}", file=sys.stderr)
-
-    # Helper to safely get values, assuming they are already parsed JSON if they are objects/arrays
-    def safe_get_field(data_dict, field_name, default_value):
-        value = data_dict.get(field_name)
-        # If it's a string, try to parse it, otherwise return as is or default
-        if isinstance(value, str):
-            try:
-                parsed_value = json.loads(value)
-                return parsed_value if parsed_value is not None else default_value
-            except json.JSONDecodeError:
-                print(f"Warning: Field '{field_name}' is a string but not valid JSON: '{value}'. Using default.", file=sys.stderr)
-                return default_value
-        return value if value is not None else default_value
+    logger.debug("Mapping input - campaign_prompt: %s", campaign_prompt)
+
+    # Fast path: when the client already decoded every JSONB container column,
+    # run the straight-line specialized mapper instead of the defensive one.
+    if not any(isinstance(supabase_creative_data.get(f), str) for f in _JSONB_CONTAINER_FIELDS):
+        mapped = _map_required_elements_fast(supabase_creative_data, campaign_prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Mapped schema (Approach-1, fast path): %s",
+                         orjson.dumps(mapped["required_elements"], option=orjson.OPT_INDENT_2).decode())
+        return mapped
+
+    # Parse the background column once instead of re-walking it per field
+    supabase_background = safe_get_field(supabase_creative_data, "background", {})
 
     # Initialize with default/fallback values for robustness
     mapped_data = {
@@ -133,9 +375,9 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
         "format": safe_get_field(supabase_creative_data, "format", "static"),
         "Canvas": {
             "background": {
-                "type": safe_get_field(supabase_creative_data.get("background", {}), "type", "solid"),
-                "color": safe_get_field(supabase_creative_data.get("background", {}), "color", "#ffffff"),
-                "description": safe_get_field(supabase_creative_data.get("background", {}), "description", ""),
+                "type": _dig(supabase_background, "type", default="solid"),
+                "color": _dig(supabase_background, "color", default="#ffffff"),
+                "description": _dig(supabase_background, "description", default=""),
                 "image": None # This will be set from imagery.background_image_url
             },
             "layout_grid": safe_get_field(supabase_creative_data, "layout_grid", "free"),
@@ -156,8 +398,8 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # --- Populate Imagery and Background Image URL ---
     supabase_imagery = safe_get_field(supabase_creative_data, "imagery", [])
-    print(f"Processed imagery (type={type(supabase_imagery)}): {supabase_imagery}", file=sys.stderr)
-    
+    logger.debug("Processed imagery (type=%s): %s", type(supabase_imagery), supabase_imagery)
+
     background_image_url = None
     if isinstance(supabase_imagery, list):
         for img_data in supabase_imagery:
@@ -168,25 +410,28 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     if background_image_url:
         mapped_data["Canvas"]["Imagery"]["background_image_url"] = background_image_url
         mapped_data["Canvas"]["background"]["image"] = background_image_url # Also assign to canvas background image field
-        print(f"Extracted background_image_url from 'imagery' array: {background_image_url}", file=sys.stderr)
+        logger.debug("Extracted background_image_url from 'imagery' array: %s", background_image_url)
     else:
         print("Warning: No 'background' type image URL found in 'imagery' array.", file=sys.stderr)
 
 
     # Populate Text_Blocks (from 'text_blocks' column)
     supabase_text_blocks = safe_get_field(supabase_creative_data, "text_blocks", [])
-    print(f"Processed text_blocks (type={type(supabase_text_blocks)}): {supabase_text_blocks}", file=sys.stderr)
-    for block in supabase_text_blocks:
-        if block is not None and isinstance(block, dict):
-            mapped_data["Canvas"]["Text_Blocks"].append({
-                "font": block.get("font_family", "Inter"),
-                "size": block.get("font_size", "medium"),
-                "text": block.get("text", ""),
-                "color": block.get("color", "#000000"),
-                "position": block.get("alignment", "center")
-            })
-        else:
-            print(f"Warning: Skipping invalid Text Block element: {block}", file=sys.stderr)
+    logger.debug("Processed text_blocks (type=%s): %s", type(supabase_text_blocks), supabase_text_blocks)
+    # Comprehensions run on C-level list building instead of per-element
+    # .append dispatch; invalid entries are reported once by count.
+    mapped_data["Canvas"]["Text_Blocks"] = [
+        {
+            "font": block.get("font_family", "Inter"),
+            "size": block.get("font_size", "medium"),
+            "text": block.get("text", ""),
+            "color": block.get("color", "#000000"),
+            "position": block.get("alignment", "center")
+        }
+        for block in supabase_text_blocks if isinstance(block, dict)
+    ]
+    if len(mapped_data["Canvas"]["Text_Blocks"]) != len(supabase_text_blocks):
+        print(f"Warning: Skipped {len(supabase_text_blocks) - len(mapped_data['Canvas']['Text_Blocks'])} invalid Text Block element(s).", file=sys.stderr)
 
 
     # Populate CTA Buttons (from 'cta_buttons' column)
@@ -194,26 +439,27 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     # NEW: Handle if cta_buttons is a dict (common from Supabase JSONB)
     if isinstance(supabase_cta_buttons, dict):
         supabase_cta_buttons = list(supabase_cta_buttons.values())
-        print(f"Converted cta_buttons from dict to list: {supabase_cta_buttons}", file=sys.stderr)
-    print(f"Processed cta_buttons (type={type(supabase_cta_buttons)}): {supabase_cta_buttons}", file=sys.stderr)
-
-    for cta in supabase_cta_buttons:
-        if cta is not None and isinstance(cta, dict):
-            mapped_data["Canvas"]["cta_buttons"].append({
-                "text": cta.get("text", "Shop Now"),
-                "color": cta.get("text_color", "#ffffff"),
-                "position": "bottom-center", # Default position if not specified elsewhere
-                "background": cta.get("bg_color", "#007bff"),
-                "style": cta.get("style", "primary"),
-                "url": cta.get("url", "https://example.com")
-            })
-        else:
-            print(f"Warning: Skipping invalid CTA button element: {cta}", file=sys.stderr)
+        logger.debug("Converted cta_buttons from dict to list: %s", supabase_cta_buttons)
+    logger.debug("Processed cta_buttons (type=%s): %s", type(supabase_cta_buttons), supabase_cta_buttons)
+
+    mapped_data["Canvas"]["cta_buttons"] = [
+        {
+            "text": cta.get("text", "Shop Now"),
+            "color": cta.get("text_color", "#ffffff"),
+            "position": "bottom-center", # Default position if not specified elsewhere
+            "background": cta.get("bg_color", "#007bff"),
+            "style": cta.get("style", "primary"),
+            "url": cta.get("url", "https://example.com")
+        }
+        for cta in supabase_cta_buttons if isinstance(cta, dict)
+    ]
+    if len(mapped_data["Canvas"]["cta_buttons"]) != len(supabase_cta_buttons):
+        print(f"Warning: Skipped {len(supabase_cta_buttons) - len(mapped_data['Canvas']['cta_buttons'])} invalid CTA button element(s).", file=sys.stderr)
 
 
     # Populate Brand Logo (from 'brand_logo' column)
     supabase_brand_logo = safe_get_field(supabase_creative_data, "brand_logo", {})
-    print(f"Processed brand_logo (type={type(supabase_brand_logo)}): {supabase_brand_logo}", file=sys.stderr)
+    logger.debug("Processed brand_logo (type=%s): %s", type(supabase_brand_logo), supabase_brand_logo)
     if isinstance(supabase_brand_logo, dict):
         mapped_data["Canvas"]["brand_logo"] = {
             "url": supabase_brand_logo.get("url", None),
@@ -229,7 +475,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Brand Colors (from 'brand_colors' column)
     supabase_brand_colors = safe_get_field(supabase_creative_data, "brand_colors", [])
-    print(f"Processed brand_colors (type={type(supabase_brand_colors)}): {supabase_brand_colors}", file=sys.stderr)
+    logger.debug("Processed brand_colors (type=%s): %s", type(supabase_brand_colors), supabase_brand_colors)
     if isinstance(supabase_brand_colors, list):
         mapped_data["Canvas"]["brand_colors"] = supabase_brand_colors
     else:
@@ -239,32 +485,104 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Slogan (from 'slogan' column)
     mapped_data["Canvas"]["slogans"] = safe_get_field(supabase_creative_data, "slogan", None)
-    print(f"Processed slogans: {mapped_data['Canvas']['slogans']}", file=sys.stderr)
+    logger.debug("Processed slogans: %s", mapped_data['Canvas']['slogans'])
 
     # Populate Legal Disclaimer (from 'legal_disclaimer' column)
     mapped_data["Canvas"]["legal_disclaimer"] = safe_get_field(supabase_creative_data, "legal_disclaimer", None)
-    print(f"Processed legal_disclaimer: {mapped_data['Canvas']['legal_disclaimer']}", file=sys.stderr)
+    logger.debug("Processed legal_disclaimer: %s", mapped_data['Canvas']['legal_disclaimer'])
 
 
     # Populate Decorative Elements (from 'decorative_elements' column)
     supabase_decorative_elements = safe_get_field(supabase_creative_data, "decorative_elements", [])
-    print(f"Processed decorative_elements (type={type(supabase_decorative_elements)}): {supabase_decorative_elements}", file=sys.stderr)
+    logger.debug("Processed decorative_elements (type=%s): %s", type(supabase_decorative_elements), supabase_decorative_elements)
     if isinstance(supabase_decorative_elements, list):
-        for element in supabase_decorative_elements:
-            if element is not None and isinstance(element, dict):
-                mapped_data["Canvas"]["decorative_elements"].append({
-                    "shape_type": element.get("shape_type", "none"),
-                    "color": element.get("color", "#cccccc"),
-                    "animation": element.get("animation", "subtle")
-                })
-            else:
-                print(f"Warning: Skipping invalid decorative element: {element}", file=sys.stderr)
+        mapped_data["Canvas"]["decorative_elements"] = [
+            {
+                "shape_type": element.get("shape_type", "none"),
+                "color": element.get("color", "#cccccc"),
+                "animation": element.get("animation", "subtle")
+            }
+            for element in supabase_decorative_elements if isinstance(element, dict)
+        ]
+        if len(mapped_data["Canvas"]["decorative_elements"]) != len(supabase_decorative_elements):
+            print(f"Warning: Skipped {len(supabase_decorative_elements) - len(mapped_data['Canvas']['decorative_elements'])} invalid decorative element(s).", file=sys.stderr)
     else:
         print(f"Warning: Unexpected type for decorative_elements: {type(supabase_decorative_elements)}. Setting to empty list.", file=sys.stderr)
         mapped_data["Canvas"]["decorative_elements"] = []
 
-    print("Mapped schema (Approach-1):", json.dumps(mapped_data, indent=2), file=sys.stderr)
-    return {"required_elements": mapped_data}
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Mapped schema (Approach-1): %s", orjson.dumps(mapped_data, option=orjson.OPT_INDENT_2).decode())
+
+    # Pack the built-up dicts into the slotted dataclass layout shared with
+    # the fast-path mapper.
+    canvas = mapped_data["Canvas"]
+    return {"required_elements": RequiredElements(
+        campaign_id=mapped_data["campaign_id"],
+        campaign_prompt=mapped_data["campaign_prompt"],
+        placement=mapped_data["placement"],
+        dimensions=mapped_data["dimensions"],
+        format=mapped_data["format"],
+        Canvas=Canvas(
+            background=Background(**canvas["background"]),
+            layout_grid=canvas["layout_grid"],
+            bleed_safe_margins=canvas["bleed_safe_margins"],
+            Imagery=Imagery(**canvas["Imagery"]),
+            Text_Blocks=canvas["Text_Blocks"],
+            cta_buttons=canvas["cta_buttons"],
+            brand_logo=canvas["brand_logo"],
+            brand_colors=canvas["brand_colors"],
+            slogans=canvas["slogans"],
+            legal_disclaimer=canvas["legal_disclaimer"],
+            decorative_elements=canvas["decorative_elements"]
+        )
+    )}
+
+# Marker proving a document already carries the responsive CSS (the skeleton
+# embeds it); seeing it lets the post-processor return immediately instead of
+# re-running the style surgery.
+_RESP_SENTINEL = "/* RESP_v1 */"
+
+# Responsive CSS blocks for the fallback post-processor. Only width/height
+# vary, so the container rule is a string.Template substituted per call and
+# the image rule is a plain constant — no per-call f-string building.
+_CONTAINER_CSS_TPL = string.Template("""
+        .creative-container {
+            /* RESP_v1 */
+            position: relative;
+            width: 100%; /* Make it fill the iframe's width */
+            padding-bottom: calc(100% * ($height / $width)); /* Maintain aspect ratio dynamically */
+            overflow: hidden;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+            border-radius: 8px;
+            background-color: #ffffff;
+            transform-origin: top left;
+        }
+        """)
+_CREATIVE_IMAGE_CSS = """
+        .creative-image {
+            position: absolute;
+            width: 100%;
+            height: 100%;
+            object-fit: contain; /* Changed from 'cover' to 'contain' */
+            top: 0;
+            left: 0;
+        }
+        """
+
+# Compiled once at import: the post-processor runs on every generated
+# document and none of these patterns ever change between calls.
+_STYLE_BLOCK_RE = re.compile(r"<style>(.*?)</style>", re.DOTALL)
+_CREATIVE_CONTAINER_RE = re.compile(r"\.creative-container\s*\{[^}]*\}", re.DOTALL)
+_CREATIVE_IMAGE_RE = re.compile(r"\.creative-image\s*\{[^}]*\}", re.DOTALL)
+_ELEM_STYLE_RE = re.compile(
+    r'(class="[^"]*(?:overlay-text|cta-button)[^"]*")\s+style="([^"]*)"',
+    re.DOTALL
+)
+# One pattern matches every convertible px property; the substitution
+# callback dispatches on the captured name, so each style string is scanned
+# once instead of search+sub per property.
+_ANY_PX_RE = re.compile(r"(left|top|width|height|font-size):\s*(\d+(?:\.\d+)?)\s*px;")
+
 
 def post_process_llm_html(llm_generated_html: str, original_width: int, original_height: int) -> str:
     """
@@ -280,56 +598,41 @@ def post_process_llm_html(llm_generated_html: str, original_width: int, original
         print("Warning: Original dimensions are invalid. Cannot apply proportional scaling.", file=sys.stderr)
         return llm_generated_html
 
+    # Fast path: a document carrying the sentinel already has the responsive
+    # CSS (skeleton output, or a previously processed document).
+    if _RESP_SENTINEL in llm_generated_html:
+        print("Responsive CSS sentinel found; skipping style rewrite.", file=sys.stderr)
+        return llm_generated_html
+
     # 1. Modify .creative-container CSS and ensure .creative-image CSS is correct
     # Find the <style> block
-    style_block_match = re.search(r"<style>(.*?)</style>", llm_generated_html, re.DOTALL)
-    
+    style_block_match = _STYLE_BLOCK_RE.search(llm_generated_html)
+
+    # Responsive CSS for creative-container and creative-image; only the
+    # aspect ratio varies per creative. Built before the branch so the
+    # no-style-block path below can use it too.
+    new_creative_container_css = _CONTAINER_CSS_TPL.substitute(
+        width=original_width, height=original_height
+    )
+    creative_image_css = _CREATIVE_IMAGE_CSS
+
     if style_block_match:
         current_styles = style_block_match.group(1)
-        
-        # Define the new responsive CSS for creative-container and creative-image
-        new_creative_container_css = f"""
-        .creative-container {{
-            position: relative;
-            width: 100%; /* Make it fill the iframe's width */
-            padding-bottom: calc(100% * ({original_height} / {original_width})); /* Maintain aspect ratio dynamically */
-            overflow: hidden;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-            border-radius: 8px;
-            background-color: #ffffff;
-            transform-origin: top left;
-        }}
-        """
-        # *** MODIFIED: Changed object-fit from 'cover' to 'contain' ***
-        creative_image_css = """
-        .creative-image {
-            position: absolute;
-            width: 100%;
-            height: 100%;
-            object-fit: contain; /* Changed from 'cover' to 'contain' */
-            top: 0;
-            left: 0;
-        }
-        """
 
         # Replace or add .creative-container styles
         if ".creative-container" in current_styles:
-            current_styles = re.sub(
-                r"\.creative-container\s*\{[^}]*\}",
+            current_styles = _CREATIVE_CONTAINER_RE.sub(
                 new_creative_container_css.strip(),
-                current_styles,
-                flags=re.DOTALL
+                current_styles
             )
         else:
             current_styles += new_creative_container_css
 
         # Replace or add .creative-image styles
         if ".creative-image" in current_styles:
-            current_styles = re.sub(
-                r"\.creative-image\s*\{[^}]*\}",
+            current_styles = _CREATIVE_IMAGE_RE.sub(
                 creative_image_css.strip(),
-                current_styles,
-                flags=re.DOTALL
+                current_styles
             )
         else:
             current_styles += creative_image_css
@@ -343,168 +646,266 @@ def post_process_llm_html(llm_generated_html: str, original_width: int, original
 
 
     # 2. Convert absolute pixel values to percentages/vw for overlay-text and cta-button
-    
+    llm_generated_html = convert_px_styles(llm_generated_html, original_width, original_height)
+
+    print("Finished post-processing HTML.", file=sys.stderr)
+    return llm_generated_html
+
+
+def convert_px_styles(html_fragment: str, original_width: int, original_height: int) -> str:
+    """Converts px left/top/width/height/font-size values in overlay-text and
+    cta-button style attributes to %/vw relative to the original canvas.
+    Works on a full document or a bare container fragment alike."""
+    if original_width <= 0 or original_height <= 0:
+        return html_fragment
+
+    # Reciprocals hoisted so the callback multiplies instead of dividing;
+    # it runs once per px property across every element in the document.
+    inv_w_pct = 100.0 / original_width
+    inv_h_pct = 100.0 / original_height
+
+    def _convert_px(m):
+        # Dispatch on the captured property name: horizontal values scale
+        # against the original width, vertical against the height, and
+        # font-size becomes vw relative to the width.
+        prop = m.group(1)
+        px_val = float(m.group(2))
+        if prop in ('left', 'width'):
+            return f"{prop}: {px_val * inv_w_pct:.4f}%;"
+        if prop in ('top', 'height'):
+            return f"{prop}: {px_val * inv_h_pct:.4f}%;"
+        return f"font-size: {px_val * inv_w_pct:.4f}vw;"
+
     def replace_px_to_percent(match):
         # match.group(1) is the class attribute, match.group(2) is the style content
         element_class = match.group(1)
-        style_str = match.group(2)
-
-        new_style_parts = []
-        
-        # Process position and size properties (left, top, width, height)
-        for prop in ['left', 'top', 'width', 'height']:
-            # Find property: value; including optional space after colon and before px
-            px_match = re.search(rf"{prop}:\s*(\d+(\.\d+)?)\s*px;", style_str)
-            if px_match:
-                px_val = float(px_match.group(1))
-                if prop in ['left', 'width']:
-                    percent_val = (px_val / original_width) * 100
-                else: # top, height
-                    percent_val = (px_val / original_height) * 100
-                new_style_parts.append(f"{prop}: {percent_val:.4f}%;")
-                # Remove the original px property from style_str to avoid duplicates
-                style_str = re.sub(rf"{prop}:\s*\d+(\.\d+)?\s*px;", "", style_str)
-            
-        # Process font-size property
-        font_size_px_match = re.search(r"font-size:\s*(\d+(\.\d+)?)\s*px;", style_str)
-        if font_size_px_match:
-            font_px_val = float(font_size_px_match.group(1))
-            # Convert to vw relative to the original creative width
-            font_vw_val = (font_px_val / original_width) * 100
-            new_style_parts.append(f"font-size: {font_vw_val:.4f}vw;")
-            style_str = re.sub(r"font-size:\s*\d+(\.\d+)?\s*px;", "", style_str)
-
-        # Keep any other original styles that were not processed, split by semicolon
-        # and filter out empty strings from potential multiple semicolons
-        remaining_styles = [part.strip() for part in style_str.split(';') if part.strip()]
-        
-        # Combine all parts with proper semicolon separation
-        final_style = "; ".join(new_style_parts + remaining_styles).strip()
-        
+        # Single pass: every px property is converted in place, untouched
+        # declarations stay exactly where they were.
+        final_style = _ANY_PX_RE.sub(_convert_px, match.group(2)).strip()
         # Reconstruct the attribute string for the HTML tag
         return f'{element_class} style="{final_style}"'
 
-    # Apply the replacement for elements with class 'overlay-text' or 'cta-button'
-    # This regex captures the class attribute group and the style attribute content group.
-    # It ensures we only modify elements that have these specific classes.
-    llm_generated_html = re.sub(
-        r'(class="[^"]*(?:overlay-text|cta-button)[^"]*")\s+style="([^"]*)"',
-        replace_px_to_percent,
-        llm_generated_html,
-        flags=re.DOTALL
-    )
+    # Only elements carrying the overlay-text / cta-button classes are touched.
+    return _ELEM_STYLE_RE.sub(replace_px_to_percent, html_fragment)
 
-    print("Finished post-processing HTML.", file=sys.stderr)
-    return llm_generated_html
 
+def _generate_html(supabase_creative_data, campaign_prompt_from_db, campaign_prompt_future,
+                   campaign_prompt_cli, llm_id, stream=False, no_cache=False):
+    """Maps one fetched creative row and runs the LLM (or cache), returning
+    (final_html, streamed_to_stdout). Shared by the CLI path and the
+    long-lived worker mode, which emit the result differently."""
+    campaign_prompt_final = campaign_prompt_cli # Initialize with CLI prompt as fallback
+    if campaign_prompt_from_db:
+        print(f"Fetched campaign_prompt from DB: '{campaign_prompt_from_db}'", file=sys.stderr)
+        campaign_prompt_final = campaign_prompt_from_db
+    else:
+        print("Warning: No embedded campaign prompt returned for this creative. Using CLI prompt.", file=sys.stderr)
 
-# -------- Main Function for Approach-1 HTML Generation --------
-def main():
-    # -------- Parse CLI args --------
-    parser = argparse.ArgumentParser(description="Generate a marketing HTML creative directly from Supabase data using an LLM.")
-    parser.add_argument("creative_id", type=str, help="ID of the creative to fetch from Supabase.")
-    parser.add_argument("campaign_prompt_cli", type=str, help="Campaign prompt (initial or fallback from CLI).")
-    parser.add_argument("--llm_type", type=str, default="gpt4o", choices=["gpt4o", "gpt4", "gpt3.5"], help="LLM type to use (default: gpt4o)")
-    args = parser.parse_args()
-
-    # -------- Setup OpenAI Client --------
-    client = OpenAI()
-    llm_id = llm_name2id[args.llm_type]
-
-    try:
-        # Phase 0: Fetch creative data from Supabase
-        supabase_creative_data = fetch_creative_data_from_supabase(args.creative_id)
+    # Phase 0.1: Map Supabase data to the expected 'required_elements' schema
+    # Use the prompt fetched from DB (or CLI fallback) for the mapped data
+    creative_data_for_processing = map_supabase_to_required_elements_schema(supabase_creative_data, campaign_prompt_final)
 
-        # Determine the campaign_id from the fetched creative data
-        campaign_id_from_creative = supabase_creative_data.get("campaign_id")
+    # This is the actual data payload that will be passed to the LLM prompt
+    creative_data = creative_data_for_processing["required_elements"]
 
-        campaign_prompt_final = args.campaign_prompt_cli # Initialize with CLI prompt as fallback
-        if campaign_id_from_creative:
-            try:
-                # Fetch the *actual* campaign_prompt from the campaigns_duplicate table
-                campaign_prompt_from_db = fetch_campaign_prompt_from_supabase(campaign_id_from_creative)
+    # Reconcile the concurrently fetched campaign prompt (fallback path only)
+    if campaign_prompt_future is not None:
+        try:
+            campaign_prompt_from_db = campaign_prompt_future.result()
+            if campaign_prompt_from_db:
                 print(f"Fetched campaign_prompt from DB: '{campaign_prompt_from_db}'", file=sys.stderr)
                 campaign_prompt_final = campaign_prompt_from_db
-            except Exception as e:
-                print(f"Warning: Could not fetch campaign prompt from DB for campaign_id {campaign_id_from_creative}: {e}. Using CLI prompt.", file=sys.stderr)
-                # campaign_prompt_final remains args.campaign_prompt_cli
-
-        # Phase 0.1: Map Supabase data to the expected 'required_elements' schema
-        # Use the prompt fetched from DB (or CLI fallback) for the mapped data
-        creative_data_for_processing = map_supabase_to_required_elements_schema(supabase_creative_data, campaign_prompt_final)
-
-        # This is the actual data payload that will be passed to the LLM prompt
-        creative_data = creative_data_for_processing["required_elements"]
-
-        # Extract original creative dimensions for post-processing
-        creative_width = creative_data.get("dimensions", {}).get("width", 1080)
-        creative_height = creative_data.get("dimensions", {}).get("height", 1920)
-        print(f"Detected original creative dimensions for post-processing: {creative_width}x{creative_height}", file=sys.stderr)
-
-
-        # -------- Build refined prompt for GPT --------
-        system_prompt = (
-            "You are an expert HTML & CSS ad designer. "
-            "Given a JSON object that describes a marketing creative — like background, imagery, text blocks, and CTA buttons — "
-            "generate a COMPLETE HTML document. "
-            "Prefer relative sizing (percentages, vw/vh) for elements within the main container where possible to ensure responsiveness. "
-            "Use absolute positioning based on the estimated-coords provided. "
-            "Ensure fonts, colors, and styles match the JSON data. "
-            "Use background images where applicable. "
-            "Make sure the HTML is visually balanced, looks professional, and resembles a typical marketing creative. "
-            "Center the entire creative container in the middle of the browser both vertically and horizontally. "
-            "Use reasonable default styling for any unspecified properties. "
-            "Output ONLY valid HTML code — no explanations."
-        )
-
-        user_prompt = f"""
-Here is the JSON describing the marketing creative layout:
-{json.dumps(creative_data, indent=2)}
-
-Please produce a complete HTML document implementing this exactly,
-using absolute positioning and applying the specified fonts, colors, background textures,
-and texts. Ensure it looks like a polished marketing ad.
-
-**IMPORTANT: The final creative must be responsive within its container, maintaining the original aspect ratio ({creative_width}x{creative_height}) and scaling its internal elements proportionally.**
-**Also, ensure the background image is entirely visible without any cropping, even if that means letterboxing/pillarboxing (empty space) is introduced.**
+                creative_data.campaign_prompt = campaign_prompt_final
+        except Exception as e:
+            print(f"Warning: Could not fetch campaign prompt from DB: {e}. Using CLI prompt.", file=sys.stderr)
+
+    # Extract original creative dimensions for post-processing
+    creative_width = _dig(creative_data.dimensions, "width", default=1080)
+    creative_height = _dig(creative_data.dimensions, "height", default=1920)
+    print(f"Detected original creative dimensions for post-processing: {creative_width}x{creative_height}", file=sys.stderr)
+
+
+    # -------- Build refined prompt for GPT --------
+    # The static instruction text lives in the module-level constants;
+    # only the dimensions and the creative JSON are substituted here.
+    # The payload goes in compact (no indent): pretty-print whitespace is
+    # pure token cost to the API and the model reads either form equally
+    # well. Sorted keys keep the bytes stable for the response cache.
+    system_prompt = SYSTEM_PROMPT
+    user_prompt = USER_PROMPT_TEMPLATE.format(
+        width=creative_width,
+        height=creative_height,
+        creative_json=orjson.dumps(creative_data, option=orjson.OPT_SORT_KEYS).decode()
+    )
 
-**CRITICAL LAYOUT INSTRUCTIONS FOR OPTIMAL VISUAL BALANCE AND READABILITY:**
+    # -------- Call GPT (with on-disk response cache) --------
+    cache_key = llm_cache.make_key(system_prompt, user_prompt, llm_id)
+    final_html = None if no_cache else llm_cache.get(cache_key)
+    streamed_to_stdout = False
 
-1.  **Strict No-Overlap Rule:** ABSOLUTELY ENSURE that no text block, CTA button, or the brand logo overlaps with any primary subjects in the background image (e.g., people, faces, products, animals, or other prominent visual elements). Identify and utilize clear, empty background space.
+    if final_html is not None:
+        print(f"LLM cache hit for key {cache_key[:12]}... Skipping API call.", file=sys.stderr)
+    else:
+        from openai import OpenAI
+        client = OpenAI()
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-2. Follow placement of text using the 'relative_position' of the text with one another.'top' for text does not necessarily mean top of the marketing creative, it means top modt text box.
+        if stream:
+            # Pipe tokens to the consumer as they are produced instead of
+            # blocking for the full document (much faster first byte).
+            llm_raw_html = gpt_generation_stream(
+                messages,
+                client.chat.completions.create,
+                llm_id=llm_id,
+                on_chunk=_emit_stdout_chunk
+            )
+            streamed_to_stdout = True
+        else:
+            response_text, _ = gpt_generation(
+                messages,
+                client.chat.completions.create,
+                llm_id=llm_id
+            )
+            llm_raw_html = response_text[0]
+
+        # The model returns only the container body now; convert its px
+        # styles and substitute into the pre-built skeleton. If it ignored
+        # instructions and produced a full document anyway, fall back to the
+        # old full-document post-processing so output stays well-formed.
+        if "<html" in llm_raw_html[:500].lower():
+            print("Warning: LLM returned a full document despite skeleton instructions; running full post-processing.", file=sys.stderr)
+            final_html = post_process_llm_html(llm_raw_html, creative_width, creative_height)
+        else:
+            # The prompt now asks for %/vw directly, so the common case is a
+            # single substring check and no conversion scan at all; any px
+            # the model emitted anyway is still converted as a safety net.
+            if "px" in llm_raw_html:
+                print("Note: LLM emitted px units despite instructions; converting to %/vw.", file=sys.stderr)
+                body = convert_px_styles(llm_raw_html, creative_width, creative_height)
+            else:
+                body = llm_raw_html
+            # safe_substitute: a stray '$' in the markup must not raise.
+            final_html = _SKELETON_TPL.safe_substitute(
+                width=creative_width, height=creative_height, body=body
+            )
+        llm_cache.set(cache_key, final_html)
 
-3.  **Guaranteed Readability:**
-    * For ALL text, ensure maximum contrast against the background. If the background image is busy or has varying colors, *add a subtle, semi-transparent background color (e.g., a slightly opaque black or white box) or a strong text-shadow behind the text* to ensure it pops and is easily readable.
-    * The text must be legible at a glance.
+    return final_html, streamed_to_stdout
 
-4. **Maintain a visual heirarcy where the background image especially the part of the image which contains people/products/animals/anything with a lot of visual features is the most important should not be masked by any other element.**"
 
-5.  **Professional Aesthetic:** The final HTML must render as a professional, clean, and visually appealing marketing advertisement. Elements should be neatly aligned and spaced, avoiding any cluttered or amateurish appearance.
+def _process_creative(supabase_creative_data, campaign_prompt_from_db, campaign_prompt_future, args, llm_id, save_path):
+    """Generates one creative and emits the final HTML to stdout (and
+    optionally save_path). Factored out of main() so single-ID and batched
+    invocations share the exact same path."""
+    final_html, streamed_to_stdout = _generate_html(
+        supabase_creative_data, campaign_prompt_from_db, campaign_prompt_future,
+        args.campaign_prompt_cli, llm_id, stream=args.stream, no_cache=args.no_cache
+    )
 
-6.  **Absolute Positioning Refinement:** Use the provided dimensions and positions as a guide, but adjust absolute `top`, `left`, `right`, `bottom` values as necessary to strictly adhere to the no-overlap and readability rules.
-"""
+    # -------- Print to stdout (disk saving is opt-in) --------
+    if not streamed_to_stdout:
+        # Encode once and write through the binary buffer: one linear pass
+        # over the document, no text-layer newline translation.
+        sys.stdout.buffer.write(final_html.encode('utf-8'))
+        sys.stdout.buffer.write(b'\n')
+        sys.stdout.flush()
+    print("\nHTML output successfully sent to stdout.", file=sys.stderr)
+
+    if save_path:
+        # Resolve the path once via pathlib; write_bytes hands the whole
+        # pre-encoded buffer to a single write() call. The directory is only
+        # created when saving is actually requested.
+        save_path = pathlib.Path(save_path).resolve()
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        save_path.write_bytes(final_html.encode('utf-8'))
+        print(f"Final HTML saved to {save_path}", file=sys.stderr) # Informative message
 
-        # -------- Call GPT --------
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
 
-        response_text, _ = gpt_generation(
-            messages,
-            client.chat.completions.create,
-            llm_id=llm_id
-        )
-
-        llm_raw_html = response_text[0]
+# -------- Main Function for Approach-1 HTML Generation --------
+def main():
+    # -------- Parse CLI args --------
+    parser = argparse.ArgumentParser(description="Generate a marketing HTML creative directly from Supabase data using an LLM.")
+    parser.add_argument("creative_ids", type=str, nargs='+',
+                        help="ID(s) of the creative(s) to fetch from Supabase. "
+                             "Multiple IDs are fetched in one batched query and "
+                             "rendered sequentially.")
+    parser.add_argument("campaign_prompt_cli", type=str, help="Campaign prompt (initial or fallback from CLI).")
+    parser.add_argument("--llm_type", type=str, default="gpt4o", help="LLM type to use (default: gpt4o)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream raw LLM output to stdout as it is generated "
+                             "(cuts time-to-first-byte; stdout then carries the raw HTML, "
+                             "responsiveness post-processing still runs for the cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Skip reading the on-disk LLM response cache for this run "
+                             "(a fresh generation is still written back to it; "
+                             "LLM_CACHE=0 disables the cache entirely)")
+    parser.add_argument("--save-to-file", type=str, default=None, metavar="PATH",
+                        help="Also save the final HTML to PATH (debugging aid; "
+                             "production consumers read stdout, so no disk write happens by default)")
+    args = parser.parse_args()
 
-        # POST-PROCESS the LLM's raw HTML for responsiveness
-        final_html = post_process_llm_html(llm_raw_html, creative_width, creative_height)
+    # argparse has already run at this point, so --help / bad-arg exits never
+    # pay for any client construction. The OpenAI client itself is built only
+    # on an actual API call (a cache hit skips it entirely), and the Supabase
+    # client comes lazily from the get_supabase() singleton.
+    # llm_name2id is the single source of truth for valid LLM names; a plain
+    # KeyError check replaces the argparse choices scan so the mapping isn't
+    # validated twice.
+    try:
+        llm_id = llm_name2id[args.llm_type]
+    except KeyError:
+        parser.error(f"invalid llm_type '{args.llm_type}'; choose from {list(llm_name2id)}")
 
-        # -------- Print to stdout (no file saving) --------
-        print(final_html)
-        print("\nHTML output successfully sent to stdout.", file=sys.stderr) # Informative message
+    try:
+        # Phase 0: Fetch creative data and its campaign prompt in one round trip.
+        # If the embedded select is unavailable (e.g. the FK relationship is
+        # missing), fall back to the two separate queries, dispatching the
+        # campaign-prompt fetch on a worker thread so it overlaps with the
+        # schema mapping below instead of blocking before it.
+        if len(args.creative_ids) == 1:
+            creative_id = args.creative_ids[0]
+            campaign_prompt_future = None
+            snapshot = _load_creative_snapshot(creative_id)
+            if snapshot is not None:
+                print(f"Fetch snapshot hit for creative {creative_id}; skipping Supabase round trips.", file=sys.stderr)
+                supabase_creative_data, campaign_prompt_from_db = snapshot
+            else:
+                try:
+                    supabase_creative_data, campaign_prompt_from_db = fetch_creative_bundle(creative_id)
+                    _save_creative_snapshot(creative_id, supabase_creative_data, campaign_prompt_from_db)
+                except Exception as e:
+                    print(f"Warning: Embedded creative/campaign fetch failed: {e}. Falling back to separate queries.", file=sys.stderr)
+                    supabase_creative_data = fetch_creative_data_from_supabase(creative_id)
+                    campaign_prompt_from_db = None
+                    campaign_id_from_creative = supabase_creative_data.get("campaign_id")
+                    if campaign_id_from_creative:
+                        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                        campaign_prompt_future = executor.submit(fetch_campaign_prompt_from_supabase, campaign_id_from_creative)
+                        executor.shutdown(wait=False)
+
+            _process_creative(supabase_creative_data, campaign_prompt_from_db,
+                              campaign_prompt_future, args, llm_id, args.save_to_file)
+        else:
+            # Batch mode: one .in_() query returns every requested row (and
+            # its campaign prompt) in a single round trip, amortizing client
+            # init and network latency across the whole set. Rendering stays
+            # sequential so the stdout stream keeps one document at a time.
+            bundles = fetch_creatives_batch(args.creative_ids)
+            for creative_id in args.creative_ids:
+                if creative_id not in bundles:
+                    print(f"Skipping creative {creative_id}: no row found.", file=sys.stderr)
+                    continue
+                supabase_creative_data, campaign_prompt_from_db = bundles[creative_id]
+                save_path = args.save_to_file
+                if save_path:
+                    # One file per creative: suffix the requested path with the ID.
+                    base, ext = os.path.splitext(save_path)
+                    save_path = f"{base}-{creative_id}{ext}"
+                _process_creative(supabase_creative_data, campaign_prompt_from_db,
+                                  None, args, llm_id, save_path)
 
     except FileNotFoundError as e:
         print(f"Error: {e}. Please ensure all required files and directories exist.", file=sys.stderr)
@@ -518,5 +919,42 @@ and texts. Ensure it looks like a polished marketing ad.
         traceback.print_exc(file=sys.stderr)
         sys.exit(1)
 
+def serve_stdin_loop():
+    """Long-lived worker mode, mirroring Approach-5: reads newline-delimited
+    JSON jobs from stdin ({"creative_id": ..., "campaign_prompt": ...}) and
+    writes one JSON response per line to stdout. Keeping the process alive
+    amortizes interpreter startup, client init and the prompt constants
+    across every job instead of paying them per spawned CLI run."""
+    llm_id = llm_name2id.get(os.getenv("WORKER_LLM_TYPE", "gpt4o"), "gpt-4o")
+    print("Worker mode: waiting for JSON jobs on stdin.", file=sys.stderr)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = orjson.loads(line)
+            creative_id = job["creative_id"]
+            try:
+                supabase_creative_data, campaign_prompt_from_db = fetch_creative_bundle(creative_id)
+            except Exception as e:
+                print(f"Warning: Embedded creative/campaign fetch failed: {e}. Falling back to separate query.", file=sys.stderr)
+                supabase_creative_data = fetch_creative_data_from_supabase(creative_id)
+                campaign_prompt_from_db = None
+            html, _ = _generate_html(
+                supabase_creative_data, campaign_prompt_from_db, None,
+                job.get("campaign_prompt", ""), llm_id
+            )
+            response = {"ok": True, "creative_id": creative_id, "html": html}
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            response = {"ok": False, "error": str(e)}
+        sys.stdout.write(orjson.dumps(response).decode() + "\n")
+        sys.stdout.flush()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if os.getenv("WORKER_MODE") == "1":
+        serve_stdin_loop()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+# llm_cache.py
+# Small on-disk cache for LLM responses so repeat runs with the same
+# creative/prompt/model skip the API call entirely (and its token cost).
+# Disable with LLM_CACHE=0 when fresh generations are wanted.
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache")
+CACHE_TTL_SECONDS = 7 * 24 * 3600  # entries older than a week are ignored
+
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+
+def make_key(system_prompt: str, user_prompt: str, llm_id: str) -> str:
+    """Builds a stable SHA-256 key from everything that determines the response."""
+    payload = json.dumps(
+        {"sys": system_prompt, "user": user_prompt, "model": llm_id},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path_for(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.html")
+
+
+def get(key: str):
+    """Returns the cached response for key, or None on miss/expiry/disabled."""
+    if not ENABLED:
+        return None
+    path = _path_for(key)
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def set(key: str, value: str):
+    """Stores value under key. Cache failures are logged, never fatal."""
+    if not ENABLED:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write-then-rename so concurrent runs never read a half-written
+        # entry; os.replace is atomic on the same filesystem.
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=CACHE_DIR,
+                                         suffix='.tmp', delete=False) as f:
+            f.write(value)
+            tmp_path = f.name
+        os.replace(tmp_path, _path_for(key))
+    except OSError as e:
+        print(f"Warning: could not write LLM cache entry: {e}", file=sys.stderr)
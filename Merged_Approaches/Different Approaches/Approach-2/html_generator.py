@@ -1,42 +1,62 @@
+import functools
+import logging
 import os
 import requests
 import json
-import cv2
-import easyocr
+import orjson
 import numpy as np
 from dotenv import load_dotenv
 import sys
-from supabase import create_client, Client
 import io
 
+# NOTE: cv2 and easyocr are imported lazily inside the functions that need
+# them. Importing them (and building the EasyOCR reader) at module scope
+# loads a PyTorch model into RAM and adds seconds of startup latency even
+# on code paths that never touch OCR (arg errors, Supabase failures).
+
+# The shared Supabase access layer lives one directory up so Approach-1 and
+# Approach-2 reuse the same client singleton and fetch helpers.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from supabase_helpers import (
+    fetch_creative_data_from_supabase,
+    fetch_campaign_prompt_from_supabase,
+    get_font_size_px,
+    safe_get_field,
+)
+
 # Load environment variables from .env file
 load_dotenv()
 
-# --- Supabase Configuration ---
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Ensure this is your service_role key
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("Error: SUPABASE_URL or SUPABASE_KEY environment variables are not set for Supabase client.", file=sys.stderr)
-    sys.exit(1)
-
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("Supabase client initialized.", file=sys.stderr)
-except Exception as e:
-    print(f"Error initializing Supabase client: {e}", file=sys.stderr)
-    sys.exit(1)
-
-# Initialize EasyOCR reader globally
-try:
-    print("Initializing EasyOCR reader (this may download models if not present)...", file=sys.stderr)
-    # Ensure EasyOCR uses the appropriate backend and that models are available
-    reader = easyocr.Reader(['en'])
-    print("EasyOCR reader initialized.", file=sys.stderr)
-except Exception as e:
-    print(f"Error initializing EasyOCR: {e}", file=sys.stderr)
-    print("Please ensure necessary EasyOCR dependencies are met, or try running 'pip install easyocr'", file=sys.stderr)
-    sys.exit(1)
+# Verbose payload dumps are gated behind LOG_LEVEL=DEBUG so the hot path
+# never serializes structures that nobody is reading.
+logging.basicConfig(stream=sys.stderr, format="%(message)s",
+                    level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# Persisting the model weights here skips the re-download on fresh containers.
+EASYOCR_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".easyocr_models")
+
+@functools.lru_cache(maxsize=1)
+def get_ocr_reader():
+    """Imports EasyOCR and builds the reader on first use, then reuses it."""
+    import easyocr
+    import torch
+    try:
+        use_gpu = torch.cuda.is_available()
+        print(f"Initializing EasyOCR reader (gpu={use_gpu}; this may download models if not present)...", file=sys.stderr)
+        # GPU when CUDA is up; on CPU, int8-quantized weights roughly double throughput.
+        reader = easyocr.Reader(
+            ['en'],
+            gpu=use_gpu,
+            quantize=not use_gpu,
+            model_storage_directory=EASYOCR_MODEL_DIR
+        )
+        print("EasyOCR reader initialized.", file=sys.stderr)
+        return reader
+    except Exception as e:
+        print(f"Error initializing EasyOCR: {e}", file=sys.stderr)
+        print("Please ensure necessary EasyOCR dependencies are met, or try running 'pip install easyocr'", file=sys.stderr)
+        sys.exit(1)
 
 # --- Helper Functions ---
 
@@ -52,56 +72,8 @@ def download_image_to_memory(image_url):
         print(f"Failed to download image from {image_url}: {e}", file=sys.stderr)
         return None
 
-def get_font_size_px(size_str):
-    """Converts a descriptive font size string to an approximate pixel value."""
-    size_map = {
-        "small": 20, "medium": 30, "large": 45,
-        "x-large": 60, "xx-large": 80, "xxx-large": 100
-    }
-    return size_map.get(size_str.lower(), 30)
-
 # --- Supabase Fetching and Mapping ---
-
-def fetch_creative_data_from_supabase(creative_id: str):
-    print(f"\n--- Fetching creative data for ID: {creative_id} from Supabase ---", file=sys.stderr)
-    try:
-        response = supabase.table('creatives_duplicate').select('*').eq('creative_id', creative_id).single().execute()
-        data = response.data
-
-        if not data:
-            print(f"No creative found with ID: {creative_id}", file=sys.stderr)
-            raise ValueError(f"Creative ID {creative_id} not found.")
-
-        print(f"Creative data fetched successfully for ID: {creative_id}", file=sys.stderr)
-        # print(f"Raw Supabase creative data: {json.dumps(data, indent=2)}", file=sys.stderr) # Keep commented for production verbosity
-        return data
-    except Exception as e:
-        print(f"Error in fetching creative data: {e}", file=sys.stderr)
-        raise
-
-def fetch_campaign_prompt_from_supabase(campaign_id: str):
-    """
-    Fetches the campaign_prompt from the 'campaigns_duplicate' table in Supabase.
-    """
-    print(f"\n--- Fetching campaign prompt for ID: {campaign_id} from Supabase ---", file=sys.stderr)
-    try:
-        response = supabase.table('campaigns_duplicate') \
-                            .select('campaign_prompt') \
-                            .eq('campaign_id', campaign_id) \
-                            .single() \
-                            .execute()
-
-        data = response.data
-
-        if not data:
-            print(f"No campaign found with ID: {campaign_id}", file=sys.stderr)
-            raise ValueError(f"Campaign ID {campaign_id} not found.")
-
-        print(f"Campaign prompt fetched successfully for ID: {campaign_id}", file=sys.stderr)
-        return data.get('campaign_prompt', "")
-    except Exception as e:
-        print(f"Error fetching campaign prompt: {e}", file=sys.stderr)
-        raise
+# (fetching lives in supabase_helpers; only the Approach-2 mapper stays here)
 
 def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campaign_prompt: str) -> dict:
     """
@@ -109,20 +81,14 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     into the 'required_elements' schema that the rest of the Python script understands.
     """
     print("\n--- Mapping Supabase data to required_elements schema ---", file=sys.stderr)
-    # print(f"Mapping input - supabase_creative_data type: {type(supabase_creative_data)}, value: {json.dumps(supabase_creative_data, indent=2)}", file=sys.stderr)
-    print(f"Mapping input - campaign_prompt: {campaign_prompt}", file=sys.stderr)
+    logger.debug("Mapping input - campaign_prompt: %s", campaign_prompt)
 
-    # Helper to safely get values, assuming they are already parsed JSON if they are objects/arrays
-    def safe_get_field(data_dict, field_name, default_value):
-        value = data_dict.get(field_name)
-        if isinstance(value, str):
-            try:
-                parsed_value = json.loads(value)
-                return parsed_value if parsed_value is not None else default_value
-            except json.JSONDecodeError:
-                print(f"Warning: Field '{field_name}' is a string but not valid JSON: '{value}'. Using default.", file=sys.stderr)
-                return default_value
-        return value if value is not None else default_value
+    # Parse the background column once instead of re-walking it per field;
+    # normalizing it to a dict up front lets the lookups below be plain .get
+    # calls instead of guarded walks.
+    supabase_background = safe_get_field(supabase_creative_data, "background", {})
+    if not isinstance(supabase_background, dict):
+        supabase_background = {}
 
     # Initialize with default/fallback values for robustness
     mapped_data = {
@@ -133,7 +99,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
         "format": safe_get_field(supabase_creative_data, "format", "static"),
         "Canvas": {
             "background": {
-                "color": safe_get_field(supabase_creative_data.get("background", {}), "color", "#ffffff"),
+                "color": supabase_background.get("color", "#ffffff"),
                 "image": None # This will be set from imagery.background_image_url
             },
             "layout_grid": safe_get_field(supabase_creative_data, "layout_grid", "free"),
@@ -155,8 +121,8 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # --- Populate Imagery and Background Image URL ---
     supabase_imagery = safe_get_field(supabase_creative_data, "imagery", [])
-    print(f"Processed imagery (type={type(supabase_imagery)}): {supabase_imagery}", file=sys.stderr)
-    
+    logger.debug("Processed imagery (type=%s): %s", type(supabase_imagery), supabase_imagery)
+
     background_image_url = None
     full_poster_image_url = None # Variable to hold the URL of the full AI-generated poster
 
@@ -165,10 +131,10 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
             if isinstance(img_data, dict) and img_data.get("url"):
                 if img_data.get("type") == "background":
                     background_image_url = img_data["url"]
-                    print(f"Extracted background_image_url from 'imagery' array: {background_image_url}", file=sys.stderr)
+                    logger.debug("Extracted background_image_url from 'imagery' array: %s", background_image_url)
                 elif img_data.get("type") == "poster": # Extract the full poster image URL
                     full_poster_image_url = img_data["url"]
-                    print(f"Extracted full_poster_image_url from 'imagery' array: {full_poster_image_url}", file=sys.stderr)
+                    logger.debug("Extracted full_poster_image_url from 'imagery' array: %s", full_poster_image_url)
     
     if background_image_url:
         mapped_data["Canvas"]["Imagery"]["background_image_url"] = background_image_url
@@ -184,7 +150,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Text_Blocks (from 'text_blocks' column)
     supabase_text_blocks = safe_get_field(supabase_creative_data, "text_blocks", [])
-    print(f"Processed text_blocks (type={type(supabase_text_blocks)}): {supabase_text_blocks}", file=sys.stderr)
+    logger.debug("Processed text_blocks (type=%s): %s", type(supabase_text_blocks), supabase_text_blocks)
     for block in supabase_text_blocks:
         if block is not None and isinstance(block, dict):
             mapped_data["Canvas"]["Text_Blocks"].append({
@@ -203,8 +169,8 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     # NEW: Handle if cta_buttons is a dict (common from Supabase JSONB)
     if isinstance(supabase_cta_buttons, dict):
         supabase_cta_buttons = list(supabase_cta_buttons.values())
-        print(f"Converted cta_buttons from dict to list: {supabase_cta_buttons}", file=sys.stderr)
-    print(f"Processed cta_buttons (type={type(supabase_cta_buttons)}): {supabase_cta_buttons}", file=sys.stderr)
+        logger.debug("Converted cta_buttons from dict to list: %s", supabase_cta_buttons)
+    logger.debug("Processed cta_buttons (type=%s): %s", type(supabase_cta_buttons), supabase_cta_buttons)
 
     for cta in supabase_cta_buttons:
         if cta is not None and isinstance(cta, dict):
@@ -220,7 +186,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Brand Logo (from 'brand_logo' column)
     supabase_brand_logo = safe_get_field(supabase_creative_data, "brand_logo", {})
-    print(f"Processed brand_logo (type={type(supabase_brand_logo)}): {supabase_brand_logo}", file=sys.stderr)
+    logger.debug("Processed brand_logo (type=%s): %s", type(supabase_brand_logo), supabase_brand_logo)
     if isinstance(supabase_brand_logo, dict):
         mapped_data["Canvas"]["brand_logo"] = {
             "url": supabase_brand_logo.get("url", None),
@@ -236,7 +202,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Brand Colors (from 'brand_colors' column)
     supabase_brand_colors = safe_get_field(supabase_creative_data, "brand_colors", [])
-    print(f"Processed brand_colors (type={type(supabase_brand_colors)}): {supabase_brand_colors}", file=sys.stderr)
+    logger.debug("Processed brand_colors (type=%s): %s", type(supabase_brand_colors), supabase_brand_colors)
     if isinstance(supabase_brand_colors, list):
         mapped_data["Canvas"]["brand_colors"] = supabase_brand_colors
     else:
@@ -245,15 +211,15 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Slogan (from 'slogan' column)
     mapped_data["Canvas"]["slogans"] = safe_get_field(supabase_creative_data, "slogan", None)
-    print(f"Processed slogans: {mapped_data['Canvas']['slogans']}", file=sys.stderr)
+    logger.debug("Processed slogans: %s", mapped_data['Canvas']['slogans'])
 
     # Populate Legal Disclaimer (from 'legal_disclaimer' column)
     mapped_data["Canvas"]["legal_disclaimer"] = safe_get_field(supabase_creative_data, "legal_disclaimer", None)
-    print(f"Processed legal_disclaimer: {mapped_data['Canvas']['legal_disclaimer']}", file=sys.stderr)
+    logger.debug("Processed legal_disclaimer: %s", mapped_data['Canvas']['legal_disclaimer'])
 
     # Populate Decorative Elements (from 'decorative_elements' column)
     supabase_decorative_elements = safe_get_field(supabase_creative_data, "decorative_elements", [])
-    print(f"Processed decorative_elements (type={type(supabase_decorative_elements)}): {supabase_decorative_elements}", file=sys.stderr)
+    logger.debug("Processed decorative_elements (type=%s): %s", type(supabase_decorative_elements), supabase_decorative_elements)
     if isinstance(supabase_decorative_elements, list):
         for element in supabase_decorative_elements:
             if element is not None and isinstance(element, dict):
@@ -268,7 +234,8 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
         print(f"Warning: Unexpected type for decorative_elements: {type(supabase_decorative_elements)}. Setting to empty list.", file=sys.stderr)
         mapped_data["Canvas"]["decorative_elements"] = []
 
-    print("Mapped schema:", json.dumps(mapped_data, indent=2), file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Mapped schema: %s", orjson.dumps(mapped_data, option=orjson.OPT_INDENT_2).decode())
     return {"required_elements": mapped_data}
 
 # ------------------------------------------------------
@@ -279,8 +246,10 @@ def extract_text_positions(image_bytes_io):
     Extracts text and their bounding box positions from an image provided as bytes (in-memory)
     using EasyOCR. Uses cv2.imdecode as requested.
     """
+    import cv2
+
     print(f"\n--- Phase 3: Extracting text positions with EasyOCR from in-memory image ---", file=sys.stderr)
-    
+
     # Read the image from bytes in memory using cv2.imdecode
     image_bytes_io.seek(0) # Ensure the stream is at the beginning
     file_bytes = image_bytes_io.read()
@@ -292,8 +261,8 @@ def extract_text_positions(image_bytes_io):
         raise ValueError(f"Could not decode image from in-memory buffer for OCR.")
 
     print(f"Image loaded into memory for OCR (dimensions: {img.shape[1]}x{img.shape[0]}px).", file=sys.stderr)
-    results = reader.readtext(img)
-    print(f"Raw EasyOCR results: {results}", file=sys.stderr)
+    results = get_ocr_reader().readtext(img)
+    logger.debug("Raw EasyOCR results: %s", results)
 
     ocr_boxes = []
     for (bbox, text, conf) in results:
@@ -317,7 +286,7 @@ def extract_text_positions(image_bytes_io):
 
     ocr_boxes.sort(key=lambda b: (b['y'], b['x']))
 
-    print("Detected text elements (from EasyOCR):", ocr_boxes, file=sys.stderr)
+    logger.debug("Detected text elements (from EasyOCR): %s", ocr_boxes)
     if not ocr_boxes:
         print("No text detected by EasyOCR after filtering.", file=sys.stderr)
     return ocr_boxes
@@ -331,9 +300,11 @@ def generate_html_with_ocr_layout(final_html_background_url: str, ocr_boxes: lis
     It uses the background URL gathered from Supabase and OCR-detected text positions.
     It fetches the dimensions of the AI-generated image directly from its URL using cv2.imdecode.
     """
+    import cv2
+
     print("\n--- Phase 4: Generating Final HTML ---", file=sys.stderr)
     print(f"HTML generation input - final_html_background_url: {final_html_background_url}", file=sys.stderr)
-    print(f"HTML generation input - ocr_boxes: {ocr_boxes}", file=sys.stderr)
+    logger.debug("HTML generation input - ocr_boxes: %s", ocr_boxes)
     print(f"HTML generation input - creative_data dimensions: {mapped_creative_data.get('dimensions')}", file=sys.stderr)
     print(f"HTML generation input - full_creative_image_url (for dimensions): {full_creative_image_url}", file=sys.stderr)
 
@@ -376,7 +347,7 @@ def generate_html_with_ocr_layout(final_html_background_url: str, ocr_boxes: lis
         if cta.get("text"):
             # Store details with normalized text as key for easy lookup
             cta_details_map[cta["text"].lower().strip()] = cta
-    print(f"CTA Details Map: {cta_details_map}", file=sys.stderr)
+    logger.debug("CTA Details Map: %s", cta_details_map)
 
 
     html_content = f"""<!DOCTYPE html>
@@ -1,59 +1,174 @@
+import concurrent.futures
+import functools
+import logging
 import os
+import re
 import requests
-import replicate
-import json
-import cv2
-import easyocr
+import orjson
+import threading
+import time
 import numpy as np # Import numpy for image array handling
 from dotenv import load_dotenv
 import sys
 from supabase import create_client, Client
 
+# NOTE: cv2, easyocr and replicate are imported lazily inside the functions
+# that need them. Importing them (and building the EasyOCR reader) at module
+# scope loads a PyTorch model into RAM and adds seconds of startup latency
+# even on code paths that never touch OCR or Replicate.
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Verbose payload dumps are gated behind LOG_LEVEL=DEBUG so the hot path
+# never serializes structures that nobody is reading.
+logging.basicConfig(stream=sys.stderr, format="%(message)s",
+                    level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+
+def _dumps(o):
+    """orjson-backed pretty dump for debug logging; the C serializer is
+    several times faster than stdlib json on the nested creative dicts."""
+    return orjson.dumps(o, option=orjson.OPT_INDENT_2).decode()
+
 # --- Supabase Configuration ---
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Ensure this is your service_role key
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("Error: SUPABASE_URL or SUPABASE_KEY environment variables are not set for Supabase client.", file=sys.stderr)
-    sys.exit(1)
+@functools.lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """Builds the Supabase client once, on first use, and reuses it.
+    Lazy construction keeps import (and --help/arg-error exits) free of the
+    client bookkeeping, and the kept-alive connection means the second query
+    in a run skips the TLS handshake."""
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")  # Ensure this is your service_role key
+
+    if not supabase_url or not supabase_key:
+        print("Error: SUPABASE_URL or SUPABASE_KEY environment variables are not set for Supabase client.", file=sys.stderr)
+        sys.exit(1)
 
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("Supabase client initialized.", file=sys.stderr)
-except Exception as e:
-    print(f"Error initializing Supabase client: {e}", file=sys.stderr)
-    sys.exit(1)
+    try:
+        client = create_client(supabase_url, supabase_key)
+        print("Supabase client initialized.", file=sys.stderr)
+        return client
+    except Exception as e:
+        print(f"Error initializing Supabase client: {e}", file=sys.stderr)
+        sys.exit(1)
 
 # --- Configuration for file paths (REMOVED as files will be handled in memory) ---
 # OUTPUT_DIR, FULL_CREATIVE_IMAGE_NAME, CLEAN_BACKGROUND_IMAGE_NAME, etc., are removed.
 
 REPLICATE_MODEL = "black-forest-labs/flux-kontext-pro"
 
-# Initialize EasyOCR reader globally
-try:
-    print("Initializing EasyOCR reader (this may download models if not present)...", file=sys.stderr)
-    reader = easyocr.Reader(['en'])
-    print("EasyOCR reader initialized.", file=sys.stderr)
-except Exception as e:
-    print(f"Error initializing EasyOCR: {e}", file=sys.stderr)
-    print("Please ensure necessary EasyOCR dependencies are met, or try running 'pip install easyocr'", file=sys.stderr)
-    sys.exit(1)
+# Repetitive prompt fragments live here so the loops below reuse one parsed
+# template per element kind instead of building a fresh f-string each time,
+# and so prompt wording can be tuned in one place.
+_TEXT_TPL = "Include '{text}' text in {color} at {position}. "
+_CTA_TPL = "Add a call-to-action button with text '{text}' and background color {background} at {position}. "
+_DECOR_TPL = "Add a {shape_type} decorative element with color {color} and {animation} animation. "
+
+# Brand names that trip the image model's content filter. The frozenset is
+# the one place the list grows; the alternation regex is derived from it at
+# import so every text block / CTA / logo string is still checked with a
+# single compiled-DFA scan regardless of how many terms are added.
+SENSITIVE_TERMS = frozenset({"hollister", "gilly hicks", "abercrombie", "nike", "adidas"})
+SENSITIVE_RE = re.compile(
+    r'\b(?:' + '|'.join(map(re.escape, sorted(SENSITIVE_TERMS))) + r')\b',
+    re.IGNORECASE
+)
+
+def sanitize_prompt_text(text, fallback):
+    """Returns fallback when text contains a sensitive brand term."""
+    if text and SENSITIVE_RE.search(text):
+        print(f"Warning: Replacing sensitive term in prompt text: '{text}' -> '{fallback}'", file=sys.stderr)
+        return fallback
+    return text
+
+# Persisting the model weights here skips the re-download on fresh containers.
+EASYOCR_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".easyocr_models")
+
+# Opt-in OCR debug rendering. Off by default: the full-frame copy, per-box
+# draw calls and JPEG encode are pure overhead in production runs.
+DEBUG_OCR = os.getenv("DEBUG_OCR") == "1"
+
+# On-disk cache of Replicate outputs keyed by a hash of the full model input.
+# A hit skips the paid model call and the image download entirely; disable
+# with REPLICATE_CACHE=0 when fresh renders are wanted.
+REPLICATE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".replicate_cache")
+REPLICATE_CACHE_ENABLED = os.getenv("REPLICATE_CACHE", "1") != "0"
+
+@functools.lru_cache(maxsize=1)
+def get_ocr_reader():
+    """Imports EasyOCR and builds the reader on first use, then reuses it."""
+    import easyocr
+    import torch
+    try:
+        use_gpu = torch.cuda.is_available()
+        print(f"Initializing EasyOCR reader (gpu={use_gpu}; this may download models if not present)...", file=sys.stderr)
+        # GPU when CUDA is up; on CPU, int8-quantized weights roughly double throughput.
+        reader = easyocr.Reader(
+            ['en'],
+            gpu=use_gpu,
+            quantize=not use_gpu,
+            model_storage_directory=EASYOCR_MODEL_DIR
+        )
+        print("EasyOCR reader initialized.", file=sys.stderr)
+        return reader
+    except Exception as e:
+        print(f"Error initializing EasyOCR: {e}", file=sys.stderr)
+        print("Please ensure necessary EasyOCR dependencies are met, or try running 'pip install easyocr'", file=sys.stderr)
+        sys.exit(1)
+
+
+def _warm_ocr_reader():
+    """Builds the reader and runs one throwaway readtext on a tiny blank
+    frame so CUDA kernel compilation / first-inference setup happens during
+    the Replicate wait instead of on the first real creative."""
+    reader = get_ocr_reader()
+    try:
+        reader.readtext(np.zeros((32, 32, 3), np.uint8))
+    except Exception as e:
+        # Warmup is best-effort; the real pass will surface any hard failure.
+        print(f"Warning: OCR warmup pass failed: {e}", file=sys.stderr)
+    return reader
 
 # --- Helper Functions ---
 
+# One session for every HTTP download so TCP/TLS connections are reused
+# across the Replicate image fetch and any later calls; the mounted adapter
+# keeps a small pool of connections alive instead of the default throwaway.
+_HTTP = requests.Session()
+_HTTP.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def _dig(d, *keys, default=None):
+    """Walks nested dicts key by key without allocating throwaway {} sentinels."""
+    for k in keys:
+        if not isinstance(d, dict):
+            return default
+        d = d.get(k)
+        if d is None:
+            return default
+    return d
+
+def _download_bytes(image_url: str) -> bytes:
+    """Fetches the raw body of an image URL over the shared session."""
+    response = _HTTP.get(image_url, timeout=30)
+    response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+    return response.content
+
 def download_image_to_memory(image_url: str) -> np.ndarray:
     """
     Downloads an image from a URL directly into memory as a NumPy array.
     This replaces the previous download_image that saved to disk.
     """
+    import cv2
+
     print(f"Downloading image from {image_url} to memory...", file=sys.stderr)
     try:
-        response = requests.get(image_url)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        image_array = np.frombuffer(response.content, np.uint8)
+        # The decoded frame needs the full body anyway, so this stays an
+        # in-memory fetch; the shared session reuses the connection and the
+        # timeout keeps a stalled CDN from hanging the pipeline.
+        image_array = np.frombuffer(_download_bytes(image_url), np.uint8)
         img_np = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
         if img_np is None:
             raise ValueError(f"Could not decode image from URL: {image_url}")
@@ -66,20 +181,25 @@ def download_image_to_memory(image_url: str) -> np.ndarray:
         print(f"Failed to decode image from {image_url}: {e}", file=sys.stderr)
         raise
 
+# Built once at module scope so loops over text blocks don't re-allocate it.
+_SIZE_MAP = {
+    "small": 20, "medium": 30, "large": 45,
+    "x-large": 60, "xx-large": 80, "xxx-large": 100
+}
+
+@functools.lru_cache(maxsize=32)
 def get_font_size_px(size_str):
-    """Converts a descriptive font size string to an approximate pixel value."""
-    size_map = {
-        "small": 20, "medium": 30, "large": 45,
-        "x-large": 60, "xx-large": 80, "xxx-large": 100
-    }
-    return size_map.get(size_str.lower(), 30)
+    """Converts a descriptive font size string to an approximate pixel value.
+    Memoized: the same handful of size labels recur across text blocks, CTAs
+    and logos, so repeat lookups skip the .lower() allocation too."""
+    return _SIZE_MAP.get(size_str.lower() if size_str else "medium", 30)
 
 # --- Supabase Fetching and Mapping ---
 
 def fetch_creative_data_from_supabase(creative_id: str):
     print(f"\n--- Fetching creative data for ID: {creative_id} from Supabase ---", file=sys.stderr)
     try:
-        response = supabase.table('creatives_duplicate').select(
+        response = get_supabase().table('creatives_duplicate').select(
             'creative_id, campaign_id, placement, dimensions, format, background, imagery, text_blocks, cta_buttons, brand_logo, brand_colors, slogan, legal_disclaimer, decorative_elements'
         ).eq('creative_id', creative_id).single().execute()
         
@@ -90,20 +210,59 @@ def fetch_creative_data_from_supabase(creative_id: str):
             raise ValueError(f"Creative ID {creative_id} not found.")
 
         print(f"Creative data fetched successfully for ID: {creative_id}", file=sys.stderr)
-        print(f"Raw Supabase creative data: {json.dumps(data, indent=2)}", file=sys.stderr)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw Supabase creative data: %s", _dumps(data))
         return data
     except Exception as e:
         print(f"Error in fetching creative data: {e}", file=sys.stderr)
         raise
 
 
+# Campaign prompts rarely change mid-session, so a warm worker does not need
+# to re-pay the round trip for every job. Entries younger than the TTL are
+# served directly; entries between TTL and 2x TTL are served stale while a
+# daemon thread refreshes them in the background.
+_CAMPAIGN_PROMPT_TTL = 600  # seconds
+_CAMPAIGN_PROMPT_CACHE = {}  # campaign_id -> (fetched_at, prompt)
+
+
+def _refresh_campaign_prompt(campaign_id: str):
+    try:
+        prompt = _fetch_campaign_prompt_uncached(campaign_id)
+        _CAMPAIGN_PROMPT_CACHE[campaign_id] = (time.time(), prompt)
+    except Exception as e:
+        print(f"Warning: Background campaign prompt refresh failed for {campaign_id}: {e}", file=sys.stderr)
+
+
 def fetch_campaign_prompt_from_supabase(campaign_id: str):
+    """
+    Fetches the campaign_prompt for a campaign, serving recent results from an
+    in-memory TTL cache (stale-while-revalidate) to skip repeat round trips.
+    """
+    now = time.time()
+    entry = _CAMPAIGN_PROMPT_CACHE.get(campaign_id)
+    if entry is not None:
+        age = now - entry[0]
+        if age < _CAMPAIGN_PROMPT_TTL:
+            return entry[1]
+        if age < _CAMPAIGN_PROMPT_TTL * 2:
+            threading.Thread(
+                target=_refresh_campaign_prompt, args=(campaign_id,), daemon=True
+            ).start()
+            return entry[1]
+
+    prompt = _fetch_campaign_prompt_uncached(campaign_id)
+    _CAMPAIGN_PROMPT_CACHE[campaign_id] = (time.time(), prompt)
+    return prompt
+
+
+def _fetch_campaign_prompt_uncached(campaign_id: str):
     """
     Fetches the campaign_prompt from the 'campaigns_duplicate' table in Supabase.
     """
     print(f"\n--- Fetching campaign prompt for ID: {campaign_id} from Supabase ---", file=sys.stderr)
     try:
-        response = supabase.table('campaigns_duplicate') \
+        response = get_supabase().table('campaigns_duplicate') \
                            .select('campaign_prompt') \
                            .eq('campaign_id', campaign_id) \
                            .single() \
@@ -122,6 +281,46 @@ def fetch_campaign_prompt_from_supabase(campaign_id: str):
         raise
 
 
+def fetch_creative_bundle(creative_id: str):
+    """
+    Fetches the creative row together with its campaign's campaign_prompt in a
+    single PostgREST round trip, using resource embedding on the campaign_id
+    foreign key. Returns (creative_data, campaign_prompt_or_None).
+    """
+    print(f"\n--- Fetching creative bundle for ID: {creative_id} from Supabase ---", file=sys.stderr)
+    try:
+        response = get_supabase().table('creatives_duplicate').select(
+            'creative_id, campaign_id, placement, dimensions, format, background, imagery, text_blocks, cta_buttons, brand_logo, brand_colors, slogan, legal_disclaimer, decorative_elements, campaigns_duplicate!campaign_id(campaign_prompt)'
+        ).eq('creative_id', creative_id).single().execute()
+        data = response.data
+
+        if not data:
+            print(f"No creative found with ID: {creative_id}", file=sys.stderr)
+            raise ValueError(f"Creative ID {creative_id} not found.")
+
+        # Pull the embedded campaign row out; the creative dict itself is
+        # passed on unchanged to the schema mapper.
+        embedded_campaign = data.pop("campaigns_duplicate", None)
+        campaign_prompt = None
+        if isinstance(embedded_campaign, dict):
+            campaign_prompt = embedded_campaign.get("campaign_prompt")
+
+        print(f"Creative bundle fetched successfully for ID: {creative_id}", file=sys.stderr)
+        return data, campaign_prompt
+    except Exception as e:
+        print(f"Error in fetching creative bundle: {e}", file=sys.stderr)
+        raise
+
+
+# Default shapes for the mapped schema, built once at import instead of as
+# fresh literals on every mapping call. _BACKGROUND_DEFAULT is copied before
+# use because the mapper writes the resolved image URL into it; the others
+# are only ever read or merged over.
+_BACKGROUND_DEFAULT = {"color": "#ffffff", "image": None, "description": ""}
+_DIMENSIONS_DEFAULT = {"width": 1080, "height": 1920}
+_BRAND_LOGO_DEFAULTS = {"url": None, "text_alt": "Brand Logo", "size": "medium", "position": "top-left"}
+
+
 def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campaign_prompt: str) -> dict:
     """
     Maps the data fetched from Supabase (where fields are top-level columns)
@@ -129,8 +328,9 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
     This version retrieves data directly from the top-level columns.
     """
     print("\n--- Mapping Supabase data to required_elements schema ---", file=sys.stderr)
-    print(f"Mapping input - supabase_creative_data type: {type(supabase_creative_data)}, value: {json.dumps(supabase_creative_data, indent=2)}", file=sys.stderr)
-    print(f"Mapping input - campaign_prompt: {campaign_prompt}", file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Mapping input - supabase_creative_data: %s", _dumps(supabase_creative_data))
+    logger.debug("Mapping input - campaign_prompt: %s", campaign_prompt)
 
     # Helper to safely get values. Supabase should ideally return JSONB columns as dicts/lists.
     def safe_get_field(data_dict, field_name, default_value):
@@ -140,22 +340,25 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
         # the client usually handles this. Add a check just in case.
         if isinstance(value, str):
             try:
-                parsed_value = json.loads(value)
+                parsed_value = orjson.loads(value)
                 return parsed_value if parsed_value is not None else default_value
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print(f"Warning: Field '{field_name}' is a string but not valid JSON: '{value}'. Using default.", file=sys.stderr)
                 return default_value
         return value if value is not None else default_value
 
     # Initialize with default/fallback values for robustness
+    background = safe_get_field(supabase_creative_data, "background", None)
+    if background is None:
+        background = dict(_BACKGROUND_DEFAULT)
     mapped_data = {
         "campaign_id": supabase_creative_data.get("campaign_id"),
         "campaign_prompt": campaign_prompt,
         "placement": safe_get_field(supabase_creative_data, "placement", "social"),
-        "dimensions": safe_get_field(supabase_creative_data, "dimensions", {"width": 1080, "height": 1920}),
+        "dimensions": safe_get_field(supabase_creative_data, "dimensions", _DIMENSIONS_DEFAULT),
         "format": safe_get_field(supabase_creative_data, "format", "static"),
         "Canvas": {
-            "background": safe_get_field(supabase_creative_data, "background", {"color": "#ffffff", "image": None, "description": ""}),
+            "background": background,
             "layout_grid": safe_get_field(supabase_creative_data, "layout_grid", "free"),
             "bleed_safe_margins": safe_get_field(supabase_creative_data, "bleed_safe_margins", None),
             "Imagery": {
@@ -170,12 +373,13 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
             "decorative_elements": [] # Populated below
         }
     }
-    print(f"Initial mapped_data Canvas structure: {json.dumps(mapped_data['Canvas'], indent=2)}", file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Initial mapped_data Canvas structure: %s", _dumps(mapped_data['Canvas']))
 
     # --- Populate Imagery and Background Image URL ---
     # The 'imagery' field is an array of objects directly from the column.
     supabase_imagery = safe_get_field(supabase_creative_data, "imagery", [])
-    print(f"Processed imagery (type={type(supabase_imagery)}): {supabase_imagery}", file=sys.stderr)
+    logger.debug("Processed imagery (type=%s): %s", type(supabase_imagery), supabase_imagery)
     
     background_image_url = None
     if isinstance(supabase_imagery, list):
@@ -195,7 +399,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Text_Blocks (from 'text_blocks' column)
     supabase_text_blocks = safe_get_field(supabase_creative_data, "text_blocks", [])
-    print(f"Processed text_blocks (type={type(supabase_text_blocks)}): {supabase_text_blocks}", file=sys.stderr)
+    logger.debug("Processed text_blocks (type=%s): %s", type(supabase_text_blocks), supabase_text_blocks)
     for block in supabase_text_blocks:
         if block is not None and isinstance(block, dict):
             mapped_data["Canvas"]["Text_Blocks"].append({
@@ -211,7 +415,7 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate CTA Buttons (from 'cta_buttons' column)
     supabase_cta_buttons = safe_get_field(supabase_creative_data, "cta_buttons", [])
-    print(f"Processed cta_buttons (type={type(supabase_cta_buttons)}): {supabase_cta_buttons}", file=sys.stderr)
+    logger.debug("Processed cta_buttons (type=%s): %s", type(supabase_cta_buttons), supabase_cta_buttons)
     for cta in supabase_cta_buttons:
         if cta is not None and isinstance(cta, dict):
             mapped_data["Canvas"]["cta_buttons"].append({
@@ -226,23 +430,22 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Brand Logo (from 'brand_logo' column)
     supabase_brand_logo = safe_get_field(supabase_creative_data, "brand_logo", {})
-    print(f"Processed brand_logo (type={type(supabase_brand_logo)}): {supabase_brand_logo}", file=sys.stderr)
+    logger.debug("Processed brand_logo (type=%s): %s", type(supabase_brand_logo), supabase_brand_logo)
     if isinstance(supabase_brand_logo, dict):
+        # Merge over the defaults; size/position aren't in the server.js output
+        # so they always come from the template.
         mapped_data["Canvas"]["brand_logo"] = {
+            **_BRAND_LOGO_DEFAULTS,
             "url": supabase_brand_logo.get("url", None),
             "text_alt": supabase_brand_logo.get("text_alt", "Brand Logo"),
-            "size": "medium", # Assume default, server.js doesn't specify size here
-            "position": "top-left" # Assume default
         }
     else:
         print(f"Warning: Unexpected type for brand_logo: {type(supabase_brand_logo)}. Using default.", file=sys.stderr)
-        mapped_data["Canvas"]["brand_logo"] = {
-            "url": None, "text_alt": "Brand Logo", "size": "medium", "position": "top-left"
-        }
+        mapped_data["Canvas"]["brand_logo"] = dict(_BRAND_LOGO_DEFAULTS)
 
     # Populate Brand Colors (from 'brand_colors' column)
     supabase_brand_colors = safe_get_field(supabase_creative_data, "brand_colors", [])
-    print(f"Processed brand_colors (type={type(supabase_brand_colors)}): {supabase_brand_colors}", file=sys.stderr)
+    logger.debug("Processed brand_colors (type=%s): %s", type(supabase_brand_colors), supabase_brand_colors)
     if isinstance(supabase_brand_colors, list):
         mapped_data["Canvas"]["brand_colors"] = supabase_brand_colors
     else:
@@ -252,16 +455,16 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
 
     # Populate Slogan (from 'slogan' column)
     mapped_data["Canvas"]["slogans"] = safe_get_field(supabase_creative_data, "slogan", None)
-    print(f"Processed slogans: {mapped_data['Canvas']['slogans']}", file=sys.stderr)
+    logger.debug("Processed slogans: %s", mapped_data['Canvas']['slogans'])
 
     # Populate Legal Disclaimer (from 'legal_disclaimer' column)
     mapped_data["Canvas"]["legal_disclaimer"] = safe_get_field(supabase_creative_data, "legal_disclaimer", None)
-    print(f"Processed legal_disclaimer: {mapped_data['Canvas']['legal_disclaimer']}", file=sys.stderr)
+    logger.debug("Processed legal_disclaimer: %s", mapped_data['Canvas']['legal_disclaimer'])
 
 
     # Populate Decorative Elements (from 'decorative_elements' column)
     supabase_decorative_elements = safe_get_field(supabase_creative_data, "decorative_elements", [])
-    print(f"Processed decorative_elements (type={type(supabase_decorative_elements)}): {supabase_decorative_elements}", file=sys.stderr)
+    logger.debug("Processed decorative_elements (type=%s): %s", type(supabase_decorative_elements), supabase_decorative_elements)
     if isinstance(supabase_decorative_elements, list):
         for element in supabase_decorative_elements:
             if element is not None and isinstance(element, dict):
@@ -277,7 +480,8 @@ def map_supabase_to_required_elements_schema(supabase_creative_data: dict, campa
         mapped_data["Canvas"]["decorative_elements"] = []
 
 
-    print("Mapped schema:", json.dumps(mapped_data, indent=2), file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Mapped schema: %s", _dumps(mapped_data))
     return {"required_elements": mapped_data}
 
 # ------------------------------------------------------
@@ -290,15 +494,19 @@ def generate_full_creative(replicate_client, creative_data):
     Returns the image URL and the image as a NumPy array (in-memory).
     """
     print("\n--- Phase 1: Generating Full Creative Image with AI ---", file=sys.stderr)
-    print(f"Input creative_data for Replicate generation: {json.dumps(creative_data, indent=2)}", file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Input creative_data for Replicate generation: %s", _dumps(creative_data))
 
     replicate_input = {}
     canvas_data = creative_data.get("Canvas", {})
-    print(f"Canvas data extracted for Replicate input: {json.dumps(canvas_data, indent=2)}", file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Canvas data extracted for Replicate input: %s", _dumps(canvas_data))
 
 
     campaign_prompt = creative_data.get("campaign_prompt", "Generate a marketing creative.")
-    main_prompt = f"{campaign_prompt}. "
+    # Accumulate prompt fragments and join once at the end; repeated `+=` on a
+    # growing str re-copies the whole prompt for every element.
+    prompt_parts = [f"{campaign_prompt}. "]
 
     dimensions = creative_data.get("dimensions", {"width": 1080, "height": 1920}) # Updated default for consistency
     replicate_input["width"] = dimensions.get("width", 1080)
@@ -307,113 +515,166 @@ def generate_full_creative(replicate_client, creative_data):
 
 
     # Pull background_image_url from the mapped Canvas.Imagery
-    background_image_url_from_mapped_schema = canvas_data.get("Imagery", {}).get("background_image_url")
+    background_image_url_from_mapped_schema = _dig(canvas_data, "Imagery", "background_image_url")
     print(f"Background image URL from mapped schema for Replicate: {background_image_url_from_mapped_schema}", file=sys.stderr)
 
+    background_color = _dig(canvas_data, "background", "color")
     if background_image_url_from_mapped_schema:
         replicate_input["image"] = background_image_url_from_mapped_schema
-        main_prompt += "Integrate these elements onto the provided background image. "
+        prompt_parts.append("Integrate these elements onto the provided background image. ")
         print(f"Using background_image_url from mapped schema for AI generation: {background_image_url_from_mapped_schema}", file=sys.stderr)
-    elif canvas_data.get("background", {}).get("color"):
-        main_prompt += f"Use a background color of {canvas_data['background']['color']}. "
-        print(f"Using background color for AI generation: {canvas_data['background']['color']}", file=sys.stderr)
+    elif background_color:
+        prompt_parts.append(f"Use a background color of {background_color}. ")
+        print(f"Using background color for AI generation: {background_color}", file=sys.stderr)
     else:
-        main_prompt += "Generate with an appropriate background. "
+        prompt_parts.append("Generate with an appropriate background. ")
         print("No specific background image or color. AI will generate background.", file=sys.stderr)
 
 
     texts_for_replicate = []
     text_blocks = canvas_data.get("Text_Blocks", [])
-    print(f"Text_Blocks for Replicate: {text_blocks}", file=sys.stderr)
+    logger.debug("Text_Blocks for Replicate: %s", text_blocks)
     for block in text_blocks:
+        # Bind fields once per block; position and friends were probed twice.
+        block_text = sanitize_prompt_text(block.get("text", ""), "the product")
+        block_position = block.get("position", "center")
         texts_for_replicate.append({
-            "text": block.get("text", ""), # Use original text for Replicate
+            "text": block_text,
             "font_size": get_font_size_px(block.get("size", "medium")),
-            "position": block.get("position", "center")
+            "position": block_position
         })
-        main_prompt += f"Include '{block.get('text', '')}' text in {block.get('color', 'black')} at {block.get('position', 'center')}. "
+        prompt_parts.append(_TEXT_TPL.format_map({
+            "text": block_text,
+            "color": block.get("color", "black"),
+            "position": block_position
+        }))
 
     cta_buttons_raw = canvas_data.get("cta_buttons", [])
     if not isinstance(cta_buttons_raw, list):
         cta_buttons = []
     else:
         cta_buttons = cta_buttons_raw
-    print(f"CTA Buttons for Replicate: {cta_buttons}", file=sys.stderr)
+    logger.debug("CTA Buttons for Replicate: %s", cta_buttons)
 
     for cta in cta_buttons:
+        cta_text = sanitize_prompt_text(cta.get("text", "Shop Now"), "Shop Now")
+        cta_position = cta.get("position", "bottom-center")
         texts_for_replicate.append({
-            "text": cta.get("text", ""), # Use original text for Replicate
+            "text": cta_text,
             "font_size": get_font_size_px("large"),
-            "position": cta.get("position", "bottom-center")
+            "position": cta_position
         })
-        main_prompt += f"Add a call-to-action button with text '{cta.get('text', 'Shop Now')}' and background color {cta.get('background', 'red')} at {cta.get('position', 'bottom-center')}. "
+        prompt_parts.append(_CTA_TPL.format_map({
+            "text": cta_text,
+            "background": cta.get("background", "red"),
+            "position": cta_position
+        }))
 
     brand_logo_info = canvas_data.get("brand_logo", {})
     brand_logo_text_alt = brand_logo_info.get("text_alt")
     brand_logo_url = brand_logo_info.get("url") # This URL might not be populated from server.js yet
-    print(f"Brand Logo Info for Replicate: {brand_logo_info}", file=sys.stderr)
+    logger.debug("Brand Logo Info for Replicate: %s", brand_logo_info)
 
 
     if brand_logo_url and isinstance(brand_logo_url, str) and brand_logo_url.startswith("http"):
-        main_prompt += f"Integrate a brand logo image visually similar to the one at {brand_logo_url} at {brand_logo_info.get('position', 'top-left')} with {brand_logo_info.get('size', 'medium')} size. "
+        prompt_parts.append(f"Integrate a brand logo image visually similar to the one at {brand_logo_url} at {brand_logo_info.get('position', 'top-left')} with {brand_logo_info.get('size', 'medium')} size. ")
         print(f"Note: Model '{REPLICATE_MODEL}' interprets logo URL from prompt. Direct logo input not available in current 'image' field.", file=sys.stderr)
     elif brand_logo_text_alt:
+        brand_logo_text_alt = sanitize_prompt_text(brand_logo_text_alt, "the brand")
+        brand_logo_position = brand_logo_info.get("position", "top-left")
         texts_for_replicate.append({
-            "text": brand_logo_text_alt, # Use original text for Replicate
+            "text": brand_logo_text_alt,
             "font_size": get_font_size_px(brand_logo_info.get("size", "medium")),
-            "position": brand_logo_info.get("position", "top-left")
+            "position": brand_logo_position
         })
-        main_prompt += f"Include brand logo text: '{brand_logo_text_alt}' at {brand_logo_info.get('position', 'top-left')}. "
+        prompt_parts.append(f"Include brand logo text: '{brand_logo_text_alt}' at {brand_logo_position}. ")
 
 
     slogans = canvas_data.get("slogans")
     if slogans and isinstance(slogans, str):
         texts_for_replicate.append({"text": slogans, "font_size": get_font_size_px("medium"), "position": "bottom-center"})
-        main_prompt += f"Include the slogan: '{slogans}'. "
-    print(f"Slogans for Replicate: {slogans}", file=sys.stderr)
+        prompt_parts.append(f"Include the slogan: '{slogans}'. ")
+    logger.debug("Slogans for Replicate: %s", slogans)
 
 
     legal_disclaimer = canvas_data.get("legal_disclaimer")
     if legal_disclaimer and isinstance(legal_disclaimer, str):
         texts_for_replicate.append({"text": legal_disclaimer, "font_size": get_font_size_px("small"), "position": "bottom-right"})
-        main_prompt += f"Include a legal disclaimer: '{legal_disclaimer}'. "
-    print(f"Legal Disclaimer for Replicate: {legal_disclaimer}", file=sys.stderr)
+        prompt_parts.append(f"Include a legal disclaimer: '{legal_disclaimer}'. ")
+    logger.debug("Legal Disclaimer for Replicate: %s", legal_disclaimer)
 
 
     brand_colors_list = canvas_data.get("brand_colors", [])
     if isinstance(brand_colors_list, list) and brand_colors_list:
-        main_prompt += f"Use brand colors: {', '.join(brand_colors_list)}. "
-    print(f"Brand Colors for Replicate: {brand_colors_list}", file=sys.stderr)
+        prompt_parts.append(f"Use brand colors: {', '.join(brand_colors_list)}. ")
+    logger.debug("Brand Colors for Replicate: %s", brand_colors_list)
 
 
     decorative_elements_raw = canvas_data.get("decorative_elements", [])
     if isinstance(decorative_elements_raw, list):
         for element in decorative_elements_raw:
             if element is not None and isinstance(element, dict):
-                main_prompt += f"Add a {element.get('shape_type', 'geometric')} decorative element with color {element.get('color', '')} and {element.get('animation', 'subtle')} animation. "
+                prompt_parts.append(_DECOR_TPL.format_map({
+                    "shape_type": element.get("shape_type", "geometric"),
+                    "color": element.get("color", ""),
+                    "animation": element.get("animation", "subtle")
+                }))
     else:
         print(f"Warning: Unexpected type for decorative_elements: {type(decorative_elements_raw)}. Skipping.", file=sys.stderr)
-    print(f"Decorative Elements for Replicate: {decorative_elements_raw}", file=sys.stderr)
+    logger.debug("Decorative Elements for Replicate: %s", decorative_elements_raw)
 
 
+    main_prompt = ''.join(prompt_parts)
     replicate_input["prompt"] = main_prompt.strip()
     replicate_input["texts"] = texts_for_replicate
 
     print("\n--- Replicate Model Input (Full Creative) ---", file=sys.stderr)
     print(f"Model: {REPLICATE_MODEL}", file=sys.stderr)
-    print(f"Input Payload: {json.dumps(replicate_input, indent=2)}", file=sys.stderr)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Input Payload: %s", _dumps(replicate_input))
     print("---------------------------------------------\n", file=sys.stderr)
 
+    # Identical inputs render identical creatives, so check the on-disk cache
+    # before paying for the model call and the download.
+    cache_key = None
+    if REPLICATE_CACHE_ENABLED:
+        import cv2
+        import hashlib
+        # Note: orjson's compact output differs byte-for-byte from stdlib
+        # json, so switching serializers invalidates previously cached keys.
+        cache_key = hashlib.sha256(
+            orjson.dumps(replicate_input, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+        cached_img_path = os.path.join(REPLICATE_CACHE_DIR, cache_key + ".img")
+        cached_url_path = os.path.join(REPLICATE_CACHE_DIR, cache_key + ".url")
+        if os.path.exists(cached_img_path) and os.path.exists(cached_url_path):
+            try:
+                with open(cached_url_path) as f:
+                    cached_url = f.read().strip()
+                with open(cached_img_path, 'rb') as f:
+                    cached_bytes = f.read()
+                cached_np = cv2.imdecode(np.frombuffer(cached_bytes, np.uint8), cv2.IMREAD_COLOR)
+                if cached_url and cached_np is not None:
+                    print(f"Replicate cache hit for key {cache_key[:12]}... Skipping model call.", file=sys.stderr)
+                    return cached_url, cached_np
+            except OSError as e:
+                print(f"Warning: Could not read Replicate cache entry: {e}", file=sys.stderr)
+
     try:
         print("Attempting to call replicate_client.run()...", file=sys.stderr)
         replicate_output_object = replicate_client.run(REPLICATE_MODEL, input=replicate_input)
         print(f"replicate_client.run() returned: {replicate_output_object}", file=sys.stderr)
         
-        if replicate_output_object is None or not hasattr(replicate_output_object, 'url'):
+        if replicate_output_object is None:
+            raise Exception(f"Replicate model '{REPLICATE_MODEL}' returned no output object.")
+
+        # Duck-typed access: the success path reads .url directly instead of
+        # paying for a hasattr probe first.
+        try:
+            output_url = replicate_output_object.url
+        except AttributeError:
             raise Exception(f"Replicate model '{REPLICATE_MODEL}' did not return a valid output object with a 'url' attribute. Received: {replicate_output_object}")
-        
-        output_url = replicate_output_object.url
-        
+
         if not output_url:
             raise Exception(f"Replicate model '{REPLICATE_MODEL}' returned an empty image URL.")
     except Exception as e:
@@ -422,8 +683,25 @@ def generate_full_creative(replicate_client, creative_data):
 
     print(f"Replicate returned full creative image URL: {output_url}", file=sys.stderr)
 
-    # Download image directly to memory for OCR processing
-    full_creative_image_np = download_image_to_memory(output_url)
+    # Download image directly to memory for OCR processing, keeping the raw
+    # bytes around so the cache stores exactly what the CDN served.
+    import cv2
+    raw_image_bytes = _download_bytes(output_url)
+    full_creative_image_np = cv2.imdecode(np.frombuffer(raw_image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if full_creative_image_np is None:
+        raise ValueError(f"Could not decode image from URL: {output_url}")
+    print(f"Image downloaded and decoded into memory. Shape: {full_creative_image_np.shape}", file=sys.stderr)
+
+    if cache_key is not None:
+        try:
+            os.makedirs(REPLICATE_CACHE_DIR, exist_ok=True)
+            with open(os.path.join(REPLICATE_CACHE_DIR, cache_key + ".img"), 'wb') as f:
+                f.write(raw_image_bytes)
+            with open(os.path.join(REPLICATE_CACHE_DIR, cache_key + ".url"), 'w') as f:
+                f.write(output_url)
+            print(f"Cached Replicate output under key {cache_key[:12]}...", file=sys.stderr)
+        except OSError as e:
+            print(f"Warning: Could not write Replicate cache entry: {e}", file=sys.stderr)
 
     return output_url, full_creative_image_np
 
@@ -454,46 +732,78 @@ def extract_text_positions(image_np_array: np.ndarray):
         raise ValueError("Invalid image data for OCR.")
 
     print(f"Image (NumPy array) loaded for OCR. Shape: {image_np_array.shape}", file=sys.stderr)
-    results = reader.readtext(image_np_array)
-    print(f"Raw EasyOCR results: {results}", file=sys.stderr)
+
+    import cv2
+
+    # Cap the detector input on the long edge — detection time scales with
+    # pixel count and downscaled text still reads fine — and hand EasyOCR
+    # RGB directly so it skips its own BGR conversion pass. OCR_MAX_EDGE
+    # lets deployments trade accuracy for speed (720 roughly quarters the
+    # FLOPs on a 1080px creative versus running at native resolution).
+    h, w = image_np_array.shape[:2]
+    scale = min(1.0, float(os.getenv("OCR_MAX_EDGE", "1600")) / max(h, w))
+    ocr_img = image_np_array
+    if scale < 1.0:
+        ocr_img = cv2.resize(image_np_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        print(f"Downscaled OCR input by {scale:.3f} to {ocr_img.shape[1]}x{ocr_img.shape[0]}px.", file=sys.stderr)
+    ocr_img = cv2.cvtColor(ocr_img, cv2.COLOR_BGR2RGB)
+
+    results = get_ocr_reader().readtext(ocr_img)
+    logger.debug("Raw EasyOCR results: %s", results)
+
+    # Box coordinates come back in the (possibly downscaled) detector frame;
+    # map them to the original image before anything consumes them.
+    inv_scale = 1.0 / scale
 
     ocr_boxes = []
-    
-    # Removed debug_img creation and drawing as we are not saving it
-    # debug_img = image_np_array.copy() 
-
-    for (bbox, text, conf) in results:
-        x_coords = [p[0] for p in bbox]
-        y_coords = [p[1] for p in bbox]
-
-        x = int(min(x_coords))
-        y = int(min(y_coords))
-        width = int(max(x_coords) - min(x_coords))
-        height = int(max(y_coords) - min(y_coords))
-
-        if conf > 0.6 and text.strip():
-            ocr_boxes.append({
-                'text': text.strip(),
-                'x': x,
-                'y': y,
-                'width': width,
-                'height': height,
-                'conf': conf
-            })
 
-            # Removed drawing for debugging purposes to avoid saving a file
-            # cv2.rectangle(debug_img, (x, y), (x + width, y + height), (0, 255, 0), 2)
-            # cv2.putText(debug_img, f"{text.strip()} ({conf:.2f})", (x, y - 5),
-            #             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1, cv2.LINE_AA)
+    # Only allocate the debug frame when the flag asks for it.
+    debug_img = image_np_array.copy() if DEBUG_OCR else None
+
+    if results:
+        # Whole-batch reduction: the confidence mask and every box's corner
+        # min/max are computed in two vectorized calls over an (N,4,2) stack
+        # instead of per-detection arrays inside the loop.
+        bboxes, texts, confs = zip(*results)
+        confs = np.fromiter(confs, dtype=np.float64, count=len(confs))
+        keep = confs > 0.6
+        if keep.any():
+            bbox_arr = np.asarray(bboxes, dtype=np.float64)[keep]
+            mins = (bbox_arr.min(axis=1) * inv_scale).astype(np.int64)
+            sizes = (bbox_arr.max(axis=1) * inv_scale).astype(np.int64) - mins
+            kept_texts = [t for t, k in zip(texts, keep) if k]
+
+            for text, conf, (x, y), (width, height) in zip(kept_texts, confs[keep], mins, sizes):
+                text = text.strip()
+                if not text:
+                    continue
+                x = int(x)
+                y = int(y)
+                width = int(width)
+                height = int(height)
+
+                ocr_boxes.append({
+                    'text': text,
+                    'x': x,
+                    'y': y,
+                    'width': width,
+                    'height': height,
+                    'conf': float(conf)
+                })
+
+                if DEBUG_OCR:
+                    cv2.rectangle(debug_img, (x, y), (x + width, y + height), (0, 255, 0), 2)
+                    cv2.putText(debug_img, f"{text} ({conf:.2f})", (x, y - 5),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1, cv2.LINE_AA)
 
     ocr_boxes.sort(key=lambda b: (b['y'], b['x']))
 
-    # Removed saving of debug image
-    # debug_output_path = os.path.join(OUTPUT_DIR, "easyocr_debug_image.jpg")
-    # cv2.imwrite(debug_output_path, debug_img)
-    # print(f"EasyOCR debug image with bounding boxes saved to {debug_output_path}", file=sys.stderr)
+    if DEBUG_OCR:
+        debug_output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "easyocr_debug_image.jpg")
+        cv2.imwrite(debug_output_path, debug_img)
+        print(f"EasyOCR debug image with bounding boxes saved to {debug_output_path}", file=sys.stderr)
 
-    print("Detected text elements (from EasyOCR):", ocr_boxes, file=sys.stderr)
+    logger.debug("Detected text elements (from EasyOCR): %s", ocr_boxes)
     if not ocr_boxes:
         print("No text detected by EasyOCR after filtering.", file=sys.stderr)
     return ocr_boxes
@@ -501,44 +811,11 @@ def extract_text_positions(image_np_array: np.ndarray):
 # ------------------------------------------------------
 # Phase 4: Generate HTML with Original Background and OCR Text Positions
 # ------------------------------------------------------
-def generate_html_with_ocr_layout(final_html_background_url: str, ocr_boxes: list, creative_data: dict, actual_creative_image_np: np.ndarray):
-    """
-    Generates the final HTML creative using the background URL gathered from Supabase
-    and OCR-detected text positions. It verifies the actual dimensions
-    of the generated image to ensure the HTML container matches.
-    This function now returns the HTML content as a string.
-    """
-    print("\n--- Phase 4: Generating Final HTML ---", file=sys.stderr)
-    print(f"HTML generation input - final_html_background_url: {final_html_background_url}", file=sys.stderr)
-    print(f"HTML generation input - ocr_boxes: {ocr_boxes}", file=sys.stderr)
-    print(f"HTML generation input - creative_data dimensions: {creative_data.get('dimensions')}", file=sys.stderr)
-
-    requested_dimensions = creative_data.get("dimensions", {"width": 1080, "height": 1920})
-    requested_width = requested_dimensions.get("width", 1080)
-    requested_height = requested_dimensions.get("height", 1920)
-
-    # Use the in-memory image to verify dimensions
-    if actual_creative_image_np is None or actual_creative_image_np.size == 0:
-        print(f"Warning: In-memory generated image is invalid. Using requested dimensions for HTML ({requested_width}x{requested_height}).", file=sys.stderr)
-        actual_creative_height = requested_height
-        actual_creative_width = requested_width
-    else:
-        actual_creative_height, actual_creative_width, _ = actual_creative_image_np.shape
-        print(f"Requested creative dimensions (from JSON): {requested_width}x{requested_height}px", file=sys.stderr)
-        print(f"Actual AI-generated image dimensions (from in-memory image): {actual_creative_width}x{actual_creative_height}px", file=sys.stderr)
-
-        if actual_creative_width != requested_width or actual_creative_height != requested_height:
-            print(f"Dimension Mismatch: AI generated image ({actual_creative_width}x{actual_creative_height}) differs from requested ({requested_width}x{requested_height}). HTML container will use actual dimensions.", file=sys.stderr)
-
-    creative_width = actual_creative_width
-    creative_height = actual_creative_height
-
-    # Using final_html_background_url which should be the URL of the "clean" (or full) image
-    if not final_html_background_url:
-        print("Warning: final_html_background_url is empty. HTML background will be empty.", file=sys.stderr)
-        final_html_background_url = ""
-
-    html_content = f"""<!DOCTYPE html>
+# The HTML skeleton is static apart from three values, so it lives here as a
+# parsed-once constant (CSS braces doubled for str.format); the per-call
+# f-string re-interpolation of the whole document goes away. Same pattern as
+# the _TEXT_TPL/_CTA_TPL prompt fragments.
+_HTML_HEADER_TPL = """<!DOCTYPE html>
 <html>
 <head>
     <title>Marketing Creative</title>
@@ -594,110 +871,217 @@ def generate_html_with_ocr_layout(final_html_background_url: str, ocr_boxes: lis
     <div class="creative-container">
         <img class="creative-image" src="{final_html_background_url}" alt="Creative Background">
 """
-    for box in ocr_boxes:
-        text_content = box['text'] 
 
-        base_font_size = box['height'] * 0.9 
-        estimated_chars_per_line = box['width'] / (base_font_size * 0.6) if base_font_size * 0.6 > 0 else len(text_content)
-        
-        if len(text_content) > estimated_chars_per_line * 1.2 and estimated_chars_per_line > 0:
-            scaling_factor = box['width'] / (len(text_content) * base_font_size * 0.6) if (len(text_content) * base_font_size * 0.6) > 0 else 1
-            font_size = base_font_size * scaling_factor * 0.9
-        else:
-            font_size = base_font_size
-        
-        font_size = max(10, min(80, font_size))
+_OVERLAY_TPL = ('        <div class="overlay-text" style="left: {l}px; top: {t}px; '
+                'width: {w}px; height: {h}px; font-size: {fs}px;">{text}</div>\n')
 
-        html_box_buffer_x = 10
-        html_box_buffer_y = 8
+_HTML_FOOTER = "    </div>\n</body>\n</html>"
 
-        left_pos = max(0, box['x'] - (html_box_buffer_x // 2))
-        top_pos = max(0, box['y'] - (html_box_buffer_y // 2))
-        
-        width_val = max(20, box['width'] + html_box_buffer_x) 
-        height_val = max(20, box['height'] + html_box_buffer_y)
-        
-        width_val = min(width_val, creative_width - left_pos)
-        height_val = min(height_val, creative_height - top_pos)
 
-        style = (f"left: {left_pos}px; top: {top_pos}px; "
-                 f"width: {width_val}px; height: {height_val}px; "
-                 f"font-size: {font_size}px;")
-        html_content += f"""        <div class="overlay-text" style="{style}">{text_content}</div>\n"""
+def generate_html_with_ocr_layout(final_html_background_url: str, ocr_boxes: list, creative_data: dict, actual_creative_image_np: np.ndarray):
+    """
+    Generates the final HTML creative using the background URL gathered from Supabase
+    and OCR-detected text positions. It verifies the actual dimensions
+    of the generated image to ensure the HTML container matches.
+    This function now returns the HTML content as a string.
+    """
+    print("\n--- Phase 4: Generating Final HTML ---", file=sys.stderr)
+    print(f"HTML generation input - final_html_background_url: {final_html_background_url}", file=sys.stderr)
+    logger.debug("HTML generation input - ocr_boxes: %s", ocr_boxes)
+    print(f"HTML generation input - creative_data dimensions: {creative_data.get('dimensions')}", file=sys.stderr)
+
+    requested_dimensions = creative_data.get("dimensions", {"width": 1080, "height": 1920})
+    requested_width = requested_dimensions.get("width", 1080)
+    requested_height = requested_dimensions.get("height", 1920)
+
+    # Use the in-memory image to verify dimensions
+    if actual_creative_image_np is None or actual_creative_image_np.size == 0:
+        print(f"Warning: In-memory generated image is invalid. Using requested dimensions for HTML ({requested_width}x{requested_height}).", file=sys.stderr)
+        actual_creative_height = requested_height
+        actual_creative_width = requested_width
+    else:
+        actual_creative_height, actual_creative_width, _ = actual_creative_image_np.shape
+        print(f"Requested creative dimensions (from JSON): {requested_width}x{requested_height}px", file=sys.stderr)
+        print(f"Actual AI-generated image dimensions (from in-memory image): {actual_creative_width}x{actual_creative_height}px", file=sys.stderr)
+
+        if actual_creative_width != requested_width or actual_creative_height != requested_height:
+            print(f"Dimension Mismatch: AI generated image ({actual_creative_width}x{actual_creative_height}) differs from requested ({requested_width}x{requested_height}). HTML container will use actual dimensions.", file=sys.stderr)
+
+    creative_width = actual_creative_width
+    creative_height = actual_creative_height
+
+    # Using final_html_background_url which should be the URL of the "clean" (or full) image
+    if not final_html_background_url:
+        print("Warning: final_html_background_url is empty. HTML background will be empty.", file=sys.stderr)
+        final_html_background_url = ""
+
+    html_content = _HTML_HEADER_TPL.format_map({
+        "creative_width": creative_width,
+        "creative_height": creative_height,
+        "final_html_background_url": final_html_background_url,
+    })
+    # Collect per-box rows and join once; += on the growing document re-copies
+    # the whole string for every overlay.
+    rows = []
+    if ocr_boxes:
+        # All box geometry is computed in one vectorized pass; the Python
+        # loop below only interpolates the precomputed values into HTML.
+        geom = np.array(
+            [(b['x'], b['y'], b['width'], b['height'], len(b['text'])) for b in ocr_boxes],
+            dtype=np.float64
+        )
+        xs, ys, widths, heights, text_lens = geom.T
+
+        base_font_sizes = heights * 0.9
+        char_widths = base_font_sizes * 0.6
+        safe_char_widths = np.where(char_widths > 0, char_widths, 1.0)
+        estimated_chars = np.where(char_widths > 0, widths / safe_char_widths, text_lens)
+
+        scale_denoms = text_lens * char_widths
+        safe_denoms = np.where(scale_denoms > 0, scale_denoms, 1.0)
+        scaling_factors = np.where(scale_denoms > 0, widths / safe_denoms, 1.0)
+
+        needs_shrink = (text_lens > estimated_chars * 1.2) & (estimated_chars > 0)
+        font_sizes = np.where(needs_shrink, base_font_sizes * scaling_factors * 0.9, base_font_sizes)
+        font_sizes = np.clip(font_sizes, 10, 80)
+
+        # Buffered positions clamped into the creative container (10px/8px pad)
+        left_pos_arr = np.maximum(0, xs - 5).astype(np.int64)
+        top_pos_arr = np.maximum(0, ys - 4).astype(np.int64)
+        width_arr = np.minimum(np.maximum(20, widths + 10), creative_width - left_pos_arr).astype(np.int64)
+        height_arr = np.minimum(np.maximum(20, heights + 8), creative_height - top_pos_arr).astype(np.int64)
+
+        for box, left_pos, top_pos, width_val, height_val, font_size in zip(
+                ocr_boxes, left_pos_arr, top_pos_arr, width_arr, height_arr, font_sizes):
+            rows.append(_OVERLAY_TPL.format_map({
+                "l": left_pos, "t": top_pos, "w": width_val, "h": height_val,
+                "fs": font_size, "text": box['text'],
+            }))
+
+    html_content += ''.join(rows) + _HTML_FOOTER
 
-    html_content += """    </div>\n</body>\n</html>"""
-    
     print("Generated HTML content prepared for output.", file=sys.stderr)
     return html_content
 
 # ------------------------------------------------------
 # Main Orchestration Process (REVISED to accept arguments and fetch from Supabase)
 # ------------------------------------------------------
-def main():
+@functools.lru_cache(maxsize=1)
+def get_replicate_client():
+    """Imports replicate and builds the client once; reused across jobs."""
+    import replicate
+
+    REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+    if not REPLICATE_API_TOKEN:
+        print("Error: REPLICATE_API_TOKEN environment variable is not set.", file=sys.stderr)
+        sys.exit(1)
+    client = replicate.Client(api_token=REPLICATE_API_TOKEN)
+    print("Replicate client initialized.", file=sys.stderr)
+    return client
+
+
+def handle(creative_id_arg, campaign_prompt_from_cli):
+    """Runs the full pipeline for one creative and returns the HTML string.
+    All heavy state (EasyOCR reader, Supabase/Replicate clients, HTTP
+    session) lives at module scope, so repeated calls in worker mode skip
+    every warmup cost after the first job."""
+    replicate_client = get_replicate_client()
+    print(f"Received creative_id: {creative_id_arg} and campaign_prompt from CLI: '{campaign_prompt_from_cli}'", file=sys.stderr)
+
+    # Phase 0: Fetch creative data and its campaign prompt in one round
+    # trip via the embedded select. If that fails (e.g. the FK
+    # relationship is missing), fall back to the two separate queries.
     try:
-        # Validate Replicate API Token
-        REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
-        if not REPLICATE_API_TOKEN:
-            print("Error: REPLICATE_API_TOKEN environment variable is not set.", file=sys.stderr)
-            sys.exit(1)
-        replicate_client = replicate.Client(api_token=REPLICATE_API_TOKEN)
-        print("Replicate client initialized.", file=sys.stderr)
-
-        # Expect creative_id and campaign_prompt as command-line arguments
-        if len(sys.argv) < 3:
-            print("Usage: python creative_html_generator.py <creative_id> <campaign_prompt>", file=sys.stderr)
-            sys.exit(1)
-        
-        creative_id_arg = sys.argv[1]
-        campaign_prompt_from_cli = sys.argv[2] 
-        print(f"Received creative_id: {creative_id_arg} and campaign_prompt from CLI: '{campaign_prompt_from_cli}'", file=sys.stderr)
-
-        # Phase 0: Fetch creative data from Supabase (now directly from columns)
+        supabase_creative_data, campaign_prompt_from_db = fetch_creative_bundle(creative_id_arg)
+    except Exception as e:
+        print(f"Warning: Embedded creative/campaign fetch failed: {e}. Falling back to separate queries.", file=sys.stderr)
         supabase_creative_data = fetch_creative_data_from_supabase(creative_id_arg)
-        
-        # Determine the campaign_id from the fetched creative data
+        campaign_prompt_from_db = None
         campaign_id_from_creative = supabase_creative_data.get("campaign_id")
-
-        campaign_prompt_final = campaign_prompt_from_cli # Default to CLI if DB fetch fails
         if campaign_id_from_creative:
             try:
-                # Fetch the *actual* campaign_prompt from the campaigns_duplicate table
                 campaign_prompt_from_db = fetch_campaign_prompt_from_supabase(campaign_id_from_creative)
-                print(f"Fetched campaign_prompt from DB: '{campaign_prompt_from_db}'", file=sys.stderr)
-                campaign_prompt_final = campaign_prompt_from_db
             except Exception as e:
                 print(f"Warning: Could not fetch campaign prompt from DB for campaign_id {campaign_id_from_creative}: {e}. Using CLI prompt.", file=sys.stderr)
 
-        # Phase 0.1: Map Supabase data to the expected 'required_elements' schema
-        creative_data_for_processing = map_supabase_to_required_elements_schema(supabase_creative_data, campaign_prompt_final)
-        
-        # Extract the background image URL from the mapped data
-        # This is the URL that will be directly used in the HTML for the main background image
-        background_image_url_for_html = creative_data_for_processing["required_elements"]["Canvas"]["Imagery"].get("background_image_url")
+    campaign_prompt_final = campaign_prompt_from_cli # Default to CLI if DB fetch fails
+    if campaign_prompt_from_db:
+        print(f"Fetched campaign_prompt from DB: '{campaign_prompt_from_db}'", file=sys.stderr)
+        campaign_prompt_final = campaign_prompt_from_db
+
+    # Phase 0.1: Map Supabase data to the expected 'required_elements' schema
+    creative_data_for_processing = map_supabase_to_required_elements_schema(supabase_creative_data, campaign_prompt_final)
+    
+    # Extract the background image URL from the mapped data
+    # This is the URL that will be directly used in the HTML for the main background image
+    background_image_url_for_html = creative_data_for_processing["required_elements"]["Canvas"]["Imagery"].get("background_image_url")
+
+    if not background_image_url_for_html:
+        print("Warning: 'Canvas.Imagery.background_image_url' is missing or malformed in the mapped data. The HTML will use a blank background.", file=sys.stderr)
+        # Allow the flow to continue, the HTML generation will handle an empty URL
+
+    # Warm the EasyOCR reader on a worker thread while Replicate renders.
+    # Loading the PyTorch models takes seconds of CPU/disk work that would
+    # otherwise serialize after the network-bound inference wait.
+    warmup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    ocr_warmup = warmup_executor.submit(_warm_ocr_reader)
+    warmup_executor.shutdown(wait=False)
+
+    # Phase 1: Generate the full creative image using Replicate.
+    # This now returns both the URL and the image as a NumPy array (in-memory).
+    full_creative_url, full_creative_image_np = generate_full_creative(replicate_client, creative_data_for_processing["required_elements"])
+
+    # Phase 2: Get the clean background URL (which is just the full creative URL)
+    clean_background_url = get_clean_background_url(full_creative_url)
+
+    # Phase 3: Extract text positions from the in-memory full creative image using EasyOCR.
+    # Block on the warmup first so only one reader is ever built.
+    ocr_warmup.result()
+    ocr_boxes = extract_text_positions(full_creative_image_np)
+
+    # Phase 4: Generate HTML with the clean background URL and OCR positions,
+    # passing the in-memory image for dimension verification.
+    html_content = generate_html_with_ocr_layout(clean_background_url, ocr_boxes, creative_data_for_processing["required_elements"], full_creative_image_np)
+
+    # No temporary image files to clean up as they were handled in memory.
+    print("\nMulti-stage creative generation pipeline completed successfully!", file=sys.stderr)
+    return html_content
 
-        if not background_image_url_for_html:
-            print("Warning: 'Canvas.Imagery.background_image_url' is missing or malformed in the mapped data. The HTML will use a blank background.", file=sys.stderr)
-            # Allow the flow to continue, the HTML generation will handle an empty URL
 
-        # Phase 1: Generate the full creative image using Replicate.
-        # This now returns both the URL and the image as a NumPy array (in-memory).
-        full_creative_url, full_creative_image_np = generate_full_creative(replicate_client, creative_data_for_processing["required_elements"])
+def serve_stdin_loop():
+    """Long-lived worker mode: reads newline-delimited JSON jobs from stdin
+    ({"creative_id": ..., "campaign_prompt": ...}) and writes one JSON
+    response per line to stdout. Keeping the process alive means the EasyOCR
+    models load once instead of on every spawned invocation."""
+    print("Worker mode: waiting for JSON jobs on stdin.", file=sys.stderr)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = orjson.loads(line)
+            html = handle(job["creative_id"], job.get("campaign_prompt", ""))
+            response = {"ok": True, "html": html}
+        except Exception as e:
+            print(f"Worker job failed: {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            response = {"ok": False, "error": str(e)}
+        sys.stdout.write(orjson.dumps(response).decode() + "\n")
+        sys.stdout.flush()
 
-        # Phase 2: Get the clean background URL (which is just the full creative URL)
-        clean_background_url = get_clean_background_url(full_creative_url)
 
-        # Phase 3: Extract text positions from the in-memory full creative image using EasyOCR
-        ocr_boxes = extract_text_positions(full_creative_image_np)
+def main():
+    try:
+        # Expect creative_id and campaign_prompt as command-line arguments
+        if len(sys.argv) < 3:
+            print("Usage: python creative_html_generator.py <creative_id> <campaign_prompt>", file=sys.stderr)
+            sys.exit(1)
 
-        # Phase 4: Generate HTML with the clean background URL and OCR positions,
-        # passing the in-memory image for dimension verification.
-        html_content = generate_html_with_ocr_layout(clean_background_url, ocr_boxes, creative_data_for_processing["required_elements"], full_creative_image_np)
+        html_content = handle(sys.argv[1], sys.argv[2])
 
-        # No temporary image files to clean up as they were handled in memory.
-        print("\nMulti-stage creative generation pipeline completed successfully!", file=sys.stderr)
-        
         # IMPORTANT: Output the HTML content to stdout so Node.js can capture it
-        print(html_content) 
+        print(html_content)
 
     except FileNotFoundError as e:
         print(f"Error: {e}. Please ensure all required files and directories exist.", file=sys.stderr)
@@ -711,6 +1095,9 @@ def main():
         traceback.print_exc(file=sys.stderr) # Print full traceback for unexpected errors
         sys.exit(1)
 
-# Run the main function
+# Run the main function (or stay resident as a worker when asked to)
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if os.getenv("WORKER_MODE") == "1":
+        serve_stdin_loop()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,209 @@
+# supabase_helpers.py
+# Shared Supabase access layer for the Approach-* html_generator scripts.
+# Keeping the client singleton and fetch helpers in one module means the
+# connection pooling, column selection and caching tweaks apply exactly once
+# instead of being maintained per approach.
+import functools
+import os
+import sys
+
+import orjson
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+# Built once at module scope so loops over text blocks don't re-allocate it.
+_SIZE_MAP = {
+    "small": 20, "medium": 30, "large": 45,
+    "x-large": 60, "xx-large": 80, "xxx-large": 100
+}
+_SIZE_GET = _SIZE_MAP.get
+
+
+def get_font_size_px(size_str):
+    """Converts a descriptive font size string to an approximate pixel value.
+    Sizes in the DB are almost always lowercase already, so the .lower()
+    allocation only happens for the odd mixed-case value."""
+    if not size_str:
+        return 30
+    if not size_str.islower():
+        size_str = size_str.lower()
+    return _SIZE_GET(size_str, 30)
+
+
+def _dig(d, *keys, default=None):
+    """Walks nested dicts key by key without allocating throwaway {} sentinels."""
+    for k in keys:
+        if not isinstance(d, dict):
+            return default
+        d = d.get(k)
+        if d is None:
+            return default
+    return d
+
+
+# Helper to safely get values, assuming they are already parsed JSON if they are objects/arrays
+def safe_get_field(data_dict, field_name, default_value):
+    value = data_dict.get(field_name)
+    # Ordered for the common cases: a missing column, then an already-decoded
+    # JSONB value. The exact type(...) is str check skips the subclass walk
+    # isinstance would do — str subclasses never come out of the client.
+    if value is None:
+        return default_value
+    if type(value) is not str:
+        return value
+    # Rare path: the column arrived as a raw JSON string; parse it once.
+    try:
+        parsed_value = orjson.loads(value)
+        return parsed_value if parsed_value is not None else default_value
+    except orjson.JSONDecodeError:
+        print(f"Warning: Field '{field_name}' is a string but not valid JSON: '{value}'. Using default.", file=sys.stderr)
+        return default_value
+
+
+@functools.lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """Builds the Supabase client once and reuses it for every fetch.
+    The client keeps its underlying HTTP connection alive, so the second
+    query in a run skips the TLS handshake instead of paying it again.
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")  # Ensure this is your service_role key
+
+    if not supabase_url or not supabase_key:
+        print("Error: SUPABASE_URL or SUPABASE_KEY environment variables are not set for Supabase client.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        client = create_client(supabase_url, supabase_key)
+        print("Supabase client initialized.", file=sys.stderr)
+        return client
+    except Exception as e:
+        print(f"Error initializing Supabase client: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+# Only the columns the mappers actually read. Pulling '*' dragged every
+# unused JSONB column (creative_spec alone can be tens of KB) over the wire
+# and through JSON parsing on both ends.
+_CREATIVE_COLUMNS = (
+    "campaign_id,placement,dimensions,format,background,imagery,text_blocks,"
+    "cta_buttons,brand_logo,brand_colors,slogan,legal_disclaimer,decorative_elements"
+)
+
+
+def fetch_creative_data_from_supabase(creative_id: str):
+    print(f"\n--- Fetching creative data for ID: {creative_id} from Supabase ---", file=sys.stderr)
+    try:
+        response = get_supabase().table('creatives_duplicate').select(_CREATIVE_COLUMNS).eq('creative_id', creative_id).limit(1).maybe_single().execute()
+        data = response.data if response is not None else None
+
+        if not data:
+            print(f"No creative found with ID: {creative_id}", file=sys.stderr)
+            raise ValueError(f"Creative ID {creative_id} not found.")
+
+        print(f"Creative data fetched successfully for ID: {creative_id}", file=sys.stderr)
+        return data
+    except Exception as e:
+        print(f"Error in fetching creative data: {e}", file=sys.stderr)
+        raise
+
+
+@functools.lru_cache(maxsize=512)
+def fetch_campaign_prompt_from_supabase(campaign_id: str):
+    """
+    Fetches the campaign_prompt from the 'campaigns_duplicate' table in Supabase.
+    Memoized per process: batch runs generate many creatives for the same
+    campaign, and the prompt doesn't change mid-batch, so repeat lookups for
+    a campaign_id skip the network round trip. Failed lookups raise and are
+    therefore not cached.
+    """
+    print(f"\n--- Fetching campaign prompt for ID: {campaign_id} from Supabase ---", file=sys.stderr)
+    try:
+        response = get_supabase().table('campaigns_duplicate') \
+                                 .select('campaign_prompt') \
+                                 .eq('campaign_id', campaign_id) \
+                                 .limit(1) \
+                                 .maybe_single() \
+                                 .execute()
+
+        data = response.data if response is not None else None
+
+        if not data:
+            print(f"No campaign found with ID: {campaign_id}", file=sys.stderr)
+            raise ValueError(f"Campaign ID {campaign_id} not found.")
+
+        print(f"Campaign prompt fetched successfully for ID: {campaign_id}", file=sys.stderr)
+        return data.get('campaign_prompt', "")
+    except Exception as e:
+        print(f"Error fetching campaign prompt: {e}", file=sys.stderr)
+        raise
+
+
+def fetch_creative_bundle(creative_id: str):
+    """
+    Fetches the creative row together with its campaign's campaign_prompt in a
+    single PostgREST round trip, using resource embedding on the campaign_id
+    foreign key. Returns (creative_data, campaign_prompt_or_None).
+    """
+    print(f"\n--- Fetching creative bundle for ID: {creative_id} from Supabase ---", file=sys.stderr)
+    try:
+        response = get_supabase().table('creatives_duplicate') \
+                                 .select(_CREATIVE_COLUMNS + ', campaigns_duplicate!campaign_id(campaign_prompt)') \
+                                 .eq('creative_id', creative_id) \
+                                 .limit(1) \
+                                 .maybe_single() \
+                                 .execute()
+        data = response.data if response is not None else None
+
+        if not data:
+            print(f"No creative found with ID: {creative_id}", file=sys.stderr)
+            raise ValueError(f"Creative ID {creative_id} not found.")
+
+        # Pull the embedded campaign row out; the creative dict itself is passed
+        # on unchanged to the schema mapper.
+        embedded_campaign = data.pop("campaigns_duplicate", None)
+        campaign_prompt = None
+        if isinstance(embedded_campaign, dict):
+            campaign_prompt = embedded_campaign.get("campaign_prompt")
+
+        print(f"Creative bundle fetched successfully for ID: {creative_id}", file=sys.stderr)
+        return data, campaign_prompt
+    except Exception as e:
+        print(f"Error in fetching creative bundle: {e}", file=sys.stderr)
+        raise
+
+
+def fetch_creatives_batch(creative_ids):
+    """
+    Fetches several creative rows (with their embedded campaign prompts) in a
+    single PostgREST round trip via .in_(). Returns a dict mapping
+    creative_id -> (creative_data, campaign_prompt_or_None); IDs with no row
+    are absent from the result.
+    """
+    print(f"\n--- Fetching {len(creative_ids)} creatives from Supabase in one query ---", file=sys.stderr)
+    try:
+        response = get_supabase().table('creatives_duplicate') \
+                                 .select('creative_id, ' + _CREATIVE_COLUMNS + ', campaigns_duplicate!campaign_id(campaign_prompt)') \
+                                 .in_('creative_id', list(creative_ids)) \
+                                 .execute()
+        rows = (response.data if response is not None else None) or []
+
+        bundles = {}
+        for row in rows:
+            embedded_campaign = row.pop("campaigns_duplicate", None)
+            campaign_prompt = None
+            if isinstance(embedded_campaign, dict):
+                campaign_prompt = embedded_campaign.get("campaign_prompt")
+            bundles[row.get("creative_id")] = (row, campaign_prompt)
+
+        missing = [cid for cid in creative_ids if cid not in bundles]
+        if missing:
+            print(f"Warning: No creative rows found for: {', '.join(missing)}", file=sys.stderr)
+        return bundles
+    except Exception as e:
+        print(f"Error in batch creative fetch: {e}", file=sys.stderr)
+        raise